@@ -2,10 +2,10 @@ import re
 from typing import List, Optional
 from urllib.parse import urlencode
 from loguru import logger
-import requests
 
 from src.clip_services.clip_base import ClipBase
 from src.models.schema import VideoClip, VideoAspect
+from src.utils import http_utils
 
 
 class PexelsService(ClipBase):
@@ -35,10 +35,10 @@ class PexelsService(ClipBase):
         logger.info(f"searching videos: {query_url}, with proxies: {self.proxy}")
 
         try:
-            r = requests.get(
+            r = http_utils.get(
                 query_url,
                 headers=headers,
-                proxies=self.proxy,
+                proxy=self.proxy,
                 verify=False,
                 timeout=(30, 60),
             )
@@ -1,10 +1,10 @@
 from typing import List, Optional
 from urllib.parse import urlencode
-import requests
 from loguru import logger
 
 from src.clip_services.clip_base import ClipBase
 from src.models.schema import VideoAspect, VideoClip
+from src.utils import http_utils
 
 
 class PixabayService(ClipBase):
@@ -26,8 +26,8 @@ class PixabayService(ClipBase):
         logger.info(f"searching videos: {query_url}, with proxies: {self.proxy}")
 
         try:
-            r = requests.get(
-                query_url, proxies=self.proxy, verify=False, timeout=(30, 60)
+            r = http_utils.get(
+                query_url, proxy=self.proxy, verify=False, timeout=(30, 60)
             )
             response = r.json()
             video_items = []
@@ -4,7 +4,7 @@ from pathlib import Path
 from dotenv import load_dotenv
 
 from src.constants.consts import PROJECT_DIR
-from src.utils.env_utils import get_bool, get_int, get_str
+from src.utils.env_utils import get_bool, get_float, get_int, get_list, get_str
 
 load_dotenv(PROJECT_DIR.joinpath(".env").as_posix())
 
@@ -37,6 +37,8 @@ class DirConfig:
     fonts: Path = PROJECT_DIR.joinpath("storage").joinpath("resource").joinpath("fonts")
     songs: Path = PROJECT_DIR.joinpath("storage").joinpath("resource").joinpath("songs")
     clips: Path = PROJECT_DIR.joinpath("storage").joinpath("clips")
+    voices: Path = PROJECT_DIR.joinpath("storage").joinpath("voices")
+    tts_cache: Path = PROJECT_DIR.joinpath("storage").joinpath("tts_cache")
 
 
 @dataclass
@@ -48,6 +50,11 @@ class AiConfig:
     whisper_download_dir = get_str("AI_WHISPER_DOWNLOAD_DIR", DirConfig.storage.joinpath(f"models/whisper-large-v3"))
     azure_speech_region = get_str("AZURE_SPEECH_REGION")
     azure_speech_key = get_str("AZURE_SPEECH_KEY")
+    tts_cache_max_bytes = get_int("AI_TTS_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+    azure_tts_pool_size = get_int("AZURE_TTS_POOL_SIZE", 2)
+    azure_tts_pool_idle_seconds = get_int("AZURE_TTS_POOL_IDLE_SECONDS", 300)
+    azure_voices_ttl_seconds = get_int("AZURE_VOICES_TTL_SECONDS", 24 * 3600)
+    azure_tts_prewarm_voices = get_list("AZURE_TTS_PREWARM_VOICES", "en-US-AvaMultilingualNeural")
 
 
 @dataclass
@@ -65,6 +72,63 @@ class ClipProviderConfig:
     pexels_api_key: str = get_str("PEXELS_API_KEY")
     pixabay_api_key: str = get_str("PIXABAY_API_KEY")
     proxy: str = get_str("CLIP_DOWNLOAD_PROXY", "")
+    # clips downloaded at the same time by one task
+    download_concurrency: int = get_int("CLIP_DOWNLOAD_CONCURRENCY", 4)
+    # an interrupted clip download is resumed where it stopped, up to this many attempts in total
+    download_attempts: int = get_int("CLIP_DOWNLOAD_ATTEMPTS", 3)
+    # kept-alive connections per provider host, and retries of failed connections and 429/5xx responses
+    http_pool_size: int = get_int("CLIP_HTTP_POOL_SIZE", 16)
+    http_retries: int = get_int("CLIP_HTTP_RETRIES", 3)
+    http_retry_backoff_seconds: float = get_float("CLIP_HTTP_RETRY_BACKOFF_SECONDS", 0.5)
+
+
+@dataclass
+class WorkerConfig:
+    # run a consumer inside the API process; disable when running `python -m src.worker` separately
+    embedded: bool = get_bool("WORKER_EMBEDDED", True)
+    id: str = get_str("WORKER_ID", "")
+    lease_seconds: int = get_int("WORKER_LEASE_SECONDS", 600)
+    concurrency: int = get_int("WORKER_CONCURRENCY", 1)
+    # replace a task process after this many tasks, returning the memory a render held on to; 0 never
+    max_tasks_per_child: int = get_int("WORKER_MAX_TASKS_PER_CHILD", 0)
+    # stages of one task that may run at the same time, e.g. speech synthesis and term generation
+    stage_threads: int = get_int("WORKER_STAGE_THREADS", 3)
+    # how often a running task asks the database whether it was cancelled
+    cancel_check_seconds: float = get_float("WORKER_CANCEL_CHECK_SECONDS", 2)
+    # task status updates closer together than this are written as one
+    status_write_interval_seconds: float = get_float("WORKER_STATUS_WRITE_INTERVAL_SECONDS", 1)
+    poll_min_seconds: float = get_float("WORKER_POLL_MIN_SECONDS", 1)
+    poll_max_seconds: float = get_float("WORKER_POLL_MAX_SECONDS", 30)
+    reaper_interval_seconds: int = get_int("WORKER_REAPER_INTERVAL_SECONDS", 60)
+    # a task without progress for this long stops extending its lease, so the reaper re-queues it
+    stall_seconds: float = get_float("WORKER_STALL_SECONDS", 900)
+    # failed messages become claimable again after retry_base * 2^(attempt-1) seconds, jittered, at most retry_max
+    retry_base_seconds: float = get_float("WORKER_RETRY_BASE_SECONDS", 30)
+    retry_max_seconds: float = get_float("WORKER_RETRY_MAX_SECONDS", 1800)
+    # processed messages older than this are moved to task_queue_archive, in batches
+    archive_after_seconds: int = get_int("WORKER_ARCHIVE_AFTER_SECONDS", 86400)
+    archive_interval_seconds: int = get_int("WORKER_ARCHIVE_INTERVAL_SECONDS", 3600)
+    archive_batch_size: int = get_int("WORKER_ARCHIVE_BATCH_SIZE", 1000)
+    # lanes this worker claims from, their weights, and slots kept free of renders for quick tasks
+    lanes = get_list("WORKER_LANES", "QUICK,RENDER")
+    lane_weights = get_list("WORKER_LANE_WEIGHTS", "QUICK:3,RENDER:1")
+    quick_reserved_slots: int = get_int("WORKER_QUICK_RESERVED_SLOTS", 1)
+
+
+@dataclass
+class StorageConfig:
+    # how often the worker runs the storage janitor, 0 disables it
+    janitor_interval_seconds: int = get_int("STORAGE_JANITOR_INTERVAL_SECONDS", 600)
+    # budgets and ages of the downloaded clips (storage/clips and cache_videos together) and of task directories,
+    # 0 for no limit
+    cache_videos_max_bytes: int = get_int("STORAGE_CACHE_VIDEOS_MAX_BYTES", 20 * 1024 ** 3)
+    cache_videos_ttl_seconds: int = get_int("STORAGE_CACHE_VIDEOS_TTL_SECONDS", 30 * 86400)
+    tasks_max_bytes: int = get_int("STORAGE_TASKS_MAX_BYTES", 50 * 1024 ** 3)
+    tasks_ttl_seconds: int = get_int("STORAGE_TASKS_TTL_SECONDS", 7 * 86400)
+    # combined-N.mp4 of finished tasks are removed once they are this old
+    intermediate_ttl_seconds: int = get_int("STORAGE_INTERMEDIATE_TTL_SECONDS", 3600)
+    # files younger than this are never removed, they may belong to a task that hasn't recorded them yet
+    min_age_seconds: int = get_int("STORAGE_MIN_AGE_SECONDS", 3600)
 
 
 @dataclass
@@ -75,6 +139,8 @@ class Env:
     CLIP: ClipProviderConfig = field(default_factory=ClipProviderConfig)
     LLM: LlmConfig = field(default_factory=LlmConfig)
     DIR: DirConfig = field(default_factory=DirConfig)
+    WORKER: WorkerConfig = field(default_factory=WorkerConfig)
+    STORAGE: StorageConfig = field(default_factory=StorageConfig)
 
 
 env = Env()
\ No newline at end of file
@@ -3,6 +3,7 @@ from enum import StrEnum
 
 class TaskStatus(StrEnum):
     FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
     INIT = "INIT"
     STARTED = "STARTED"
     TERMS_GENERATED = "TERMS_GENERATED"
@@ -23,6 +24,17 @@ class StopAt(StrEnum):
     MATERIALS = "MATERIALS"
 
 
+class QueueLane(StrEnum):
+    QUICK = "QUICK"     # script, audio and subtitle tasks, seconds long
+    RENDER = "RENDER"   # tasks that download clips and render videos, minutes long
+
+    @classmethod
+    def from_stop_at(cls, stop_at: StopAt) -> "QueueLane":
+        if stop_at in (StopAt.SCRIPT, StopAt.AUDIO, StopAt.SUBTITLE):
+            return cls.QUICK
+        return cls.RENDER
+
+
 class PostStatus(StrEnum):
     FAILED = "FAILED"
     INIT = "INIT"
@@ -22,7 +22,7 @@ from src.models.schema import (
     TaskQueryResponse,
     TaskResponse,
 )
-from src.utils import utils
+from src.utils import file_utils, utils
 
 # 认证依赖项
 # router = new_router(dependencies=[Depends(base.verify_token)])
@@ -35,6 +35,7 @@ async def stream_video(request: Request, file_path: str):
     video_path = os.path.join(tasks_dir, file_path)
     range_header = request.headers.get("Range")
     video_size = os.path.getsize(video_path)
+    file_utils.touch(video_path)
     start, end = 0, video_size - 1
 
     length = video_size
@@ -81,6 +82,7 @@ async def download_video(_: Request, file_path: str):
     """
     tasks_dir = utils.task_dir()
     video_path = os.path.join(tasks_dir, file_path)
+    file_utils.touch(video_path)
     file_path = pathlib.Path(video_path)
     filename = file_path.stem
     extension = file_path.suffix
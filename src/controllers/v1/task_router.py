@@ -5,11 +5,9 @@ from loguru import logger
 from fastapi_pagination import Params, Page
 from fastapi import APIRouter
 
-from src.constants.consts import TASK_QUEUE_NAME
 from src.constants.enums import StopAt
 from src.crud.task_crud import TaskCrud
 from src.db.models import Task
-from src.services.queue_service import QueueService
 from src.models.exception import HttpException
 from src.models.schema import TaskDeletionResponse, TaskIdOut, SubtitleRequest, \
     AudioRequest, TaskStatusOut, TaskOut, TaskLiteOut, VideoRequest
@@ -20,25 +18,26 @@ router = APIRouter(tags=["Task"], prefix="/tasks")
 task_service = TaskService()
 
 
+def _add_task(body, stop_at: StopAt) -> TaskIdOut:
+    task_id, created = TaskCrud.add_task(params=body, stop_at=stop_at)
+    if not created:
+        logger.info(f"reusing task {task_id} of an identical request")
+    return TaskIdOut(task_id=task_id, reused=not created)
+
+
 @router.post("/audio", response_model=TaskIdOut, summary="Generate audio task")
 async def create_audio(body: AudioRequest):
-    task_id = TaskCrud.add_task(params=body, stop_at=StopAt.AUDIO)
-    QueueService.send(TASK_QUEUE_NAME, {"task_id": task_id})
-    return TaskIdOut(task_id=task_id)
+    return _add_task(body, StopAt.AUDIO)
 
 
 @router.post("/subtitle", response_model=TaskIdOut, summary="Generate audio and subtitle task")
 def create_subtitle(body: SubtitleRequest):
-    task_id = TaskCrud.add_task(params=body, stop_at=StopAt.SUBTITLE)
-    QueueService.send(TASK_QUEUE_NAME, {"task_id": task_id})
-    return TaskIdOut(task_id=task_id)
+    return _add_task(body, StopAt.SUBTITLE)
 
 
 @router.post("/videos", response_model=TaskIdOut, summary="Generate audio, subtitle and video task")
 def create_video(body: VideoRequest):
-    task_id = TaskCrud.add_task(params=body, stop_at=StopAt.VIDEO)
-    QueueService.send(TASK_QUEUE_NAME, {"task_id": task_id})
-    return TaskIdOut(task_id=task_id)
+    return _add_task(body, StopAt.VIDEO)
 
 
 @router.get("", response_model=Page[TaskLiteOut], summary="Get all tasks")
@@ -79,15 +78,17 @@ def get_task_status(
     response_model=TaskDeletionResponse,
     summary="Delete a generated short video task",
 )
-def delete_video(task_id: int = Path(..., description="Task ID")):
+def delete_video(task_id: str = Path(..., description="Task ID")):
     task = TaskCrud.get_task(task_id)
     if task:
+        # a worker still running the task stops at its next cancellation check and removes the task
+        TaskCrud.cancel_task(task_id)
+
         tasks_dir = utils.task_dir()
-        current_task_dir = os.path.join(tasks_dir, task_id)
+        current_task_dir = os.path.join(tasks_dir, str(task.id))
         if os.path.exists(current_task_dir):
             shutil.rmtree(current_task_dir)
 
-        TaskCrud.delete_task(task_id)
         logger.success(f"video deleted: {utils.to_json(task)}")
         return utils.get_response(200)
 
@@ -1,21 +1,37 @@
 from turtle import update
+from typing import Tuple
+
 from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select
+from sqlalchemy import exists, or_, select
 from fastapi_pagination import Page, Params
 from fastapi_pagination.ext.sqlalchemy import paginate
 from pydantic import BaseModel
 
-from src.constants.enums import StopAt, TaskStatus
+from src.constants.consts import TASK_QUEUE_NAME
+from src.constants.enums import QueueLane, StopAt, TaskStatus
 from src.db.connection import SessionLocal
-from src.db.models import Task, Clip, Term, ClipTerm
+from src.db.models import Task, Clip, Term, ClipTerm, TaskQueue
+from src.services.queue_notifier import queue_notifier
+from src.services.queue_service import QueueService
+from src.utils import utils
+from src.utils.utils import to_uuid
+
+# params that don't change the output of a task
+_FINGERPRINT_EXCLUDED = ("reuse_existing", "n_threads")
+# tasks that can't be reused by an identical request
+_NOT_REUSABLE_STATUSES = (TaskStatus.FAILED.value, TaskStatus.CANCELLED.value)
 
 
 class TaskCrud:
     @staticmethod
     def get_task(task_id: str):
+        try:
+            task_id = to_uuid(task_id)
+        except ValueError:
+            return None
         with SessionLocal() as session:
             return session.query(Task).filter(Task.id == task_id).first()
 
@@ -26,17 +42,49 @@ class TaskCrud:
             return paginate(session, query, params)
 
     @staticmethod
-    def add_task(params: BaseModel, stop_at: StopAt) -> str:
-        task = Task(stop_at=stop_at.value, params=params.model_dump())
+    def fingerprint(params: BaseModel, stop_at: StopAt) -> str:
+        data = params.model_dump(mode="json", exclude=set(_FINGERPRINT_EXCLUDED))
+        return utils.fingerprint({"stop_at": stop_at.value, "params": data})
+
+    @staticmethod
+    def add_task(params: BaseModel, stop_at: StopAt) -> Tuple[str, bool]:
+        """Add and queue a task, or find a queued, running or finished one with the same fingerprint.
+
+        The task and its queue message are committed together, so a reused task is always picked up
+        by a worker. Identical requests arriving at the same moment may still both create a task;
+        that only costs the duplicate work.
+
+        Returns the task id and whether the task was created.
+        """
+        fingerprint = TaskCrud.fingerprint(params, stop_at)
         with SessionLocal() as session:
+            if getattr(params, "reuse_existing", True):
+                existing = (
+                    session.query(Task.id)
+                    .filter(
+                        Task.fingerprint == fingerprint,
+                        Task.status.notin_(_NOT_REUSABLE_STATUSES),
+                        # tasks left behind unqueued, e.g. created before their message was sent in this transaction
+                        or_(Task.status != TaskStatus.INIT.value, exists().where(TaskQueue.task_id == Task.id)),
+                    )
+                    .order_by(Task.created_at.desc())
+                    .first()
+                )
+                if existing:
+                    return str(existing.id), False
+
+            task = Task(stop_at=stop_at.value, params=params.model_dump(), fingerprint=fingerprint)
             session.add(task)
+            session.flush()
+            QueueService.enqueue(session, TASK_QUEUE_NAME, {"task_id": str(task.id)}, QueueLane.from_stop_at(stop_at))
             session.commit()
-            return str(task.id)
+            queue_notifier.notify_local()
+            return str(task.id), True
 
     @staticmethod
     def update_task(id: str, status: TaskStatus, result: dict = None, failed_reason: str = "") -> int:
         with SessionLocal() as session:
-            task = session.query(Task).filter(Task.id == id).first()
+            task = session.query(Task).filter(Task.id == to_uuid(id)).first()
             if task:
                 task.status = status.value
                 if result:
@@ -47,11 +95,33 @@ class TaskCrud:
 
             return task.id
 
+    @staticmethod
+    def cancel_task(task_id: str):
+        """Mark a task CANCELLED and drop its pending queue message.
+
+        A task no worker holds a lease on is deleted right away. A running one keeps its row,
+        so the worker notices the status, stops and purges the task itself, see process_task.
+        """
+        with SessionLocal() as session:
+            task = session.query(Task).filter(Task.id == to_uuid(task_id)).first()
+            if not task:
+                return None
+            task.status = TaskStatus.CANCELLED.value
+            session.query(TaskQueue).filter(
+                TaskQueue.task_id == task.id, or_(TaskQueue.lease_owner.is_(None), TaskQueue.processed == True),
+            ).delete(synchronize_session=False)
+            if not session.query(exists().where(TaskQueue.task_id == task.id)).scalar():
+                session.delete(task)
+            session.commit()
+            return task
+
     @staticmethod
     def delete_task(task_id: str):
+        """Delete a task and its queue message"""
         with SessionLocal() as session:
-            task = session.query(Task).filter(Task.id == task_id).first()
+            task = session.query(Task).filter(Task.id == to_uuid(task_id)).first()
             if task:
+                session.query(TaskQueue).filter(TaskQueue.task_id == task.id).delete(synchronize_session=False)
                 session.delete(task)
                 session.commit()
                 return task
@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import JSON, cast, func, literal, text, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from src.constants.enums import TaskStatus
+from src.db.connection import SessionLocal
+from src.db.models import Task
+from src.utils.utils import to_uuid
+
+# written as soon as they are set, everything else may be coalesced
+_IMMEDIATE_STATUSES = (TaskStatus.FAILED, TaskStatus.FINAL_VIDEO_GENERATED)
+
+
+class TaskStatusWriter:
+    """Writes the status and result of one running task through a single session.
+
+    Result fields are merged into the stored result instead of replacing it, and updates arriving
+    within `min_interval` seconds of the last write are coalesced into one. Pending changes are
+    written by a timer, on `flush()` and when the writer is closed.
+    """
+
+    def __init__(self, task_id: str, min_interval: float = 1.0):
+        self.task_id = to_uuid(task_id)
+        self.min_interval = min_interval
+        self._session: Session = SessionLocal()
+        self._lock = threading.RLock()
+        self._status: Optional[TaskStatus] = None
+        self._result = {}
+        self._failed_reason = ""
+        self._metrics: Optional[dict] = None
+        self._checkpoints: Optional[dict] = None
+        self._last_write = 0.0
+        self._timer: Optional[threading.Timer] = None
+
+    def update(self, status: TaskStatus = None, result: dict = None, failed_reason: str = "", metrics: dict = None,
+               checkpoints: dict = None):
+        """Queue changes for the next write; `metrics` and `checkpoints` replace the stored ones"""
+        with self._lock:
+            self._status = status or self._status
+            self._result.update(result or {})
+            self._failed_reason = failed_reason or self._failed_reason
+            self._metrics = metrics if metrics is not None else self._metrics
+            self._checkpoints = checkpoints if checkpoints is not None else self._checkpoints
+
+            wait = self._last_write + self.min_interval - time.monotonic()
+            if status in _IMMEDIATE_STATUSES or wait <= 0:
+                self.flush()
+            elif not self._timer:
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            values = {}
+            if self._status:
+                values[Task.status] = self._status.value
+            if self._result:
+                values[Task.result] = self._merged_result(self._result)
+            if self._failed_reason:
+                values[Task.failed_reason] = self._failed_reason
+            if self._metrics is not None:
+                values[Task.metrics] = self._metrics
+            if self._checkpoints is not None:
+                values[Task.checkpoints] = self._checkpoints
+            if not values:
+                return
+
+            try:
+                self._session.execute(
+                    update(Task)
+                    .where(Task.id == self.task_id, Task.status != TaskStatus.CANCELLED.value)
+                    .values(values)
+                    .execution_options(synchronize_session=False)
+                )
+                self._session.commit()
+            except Exception as e:
+                self._session.rollback()
+                logger.error(f"failed to update task {self.task_id}: {e}")
+                return
+
+            self._status, self._result, self._failed_reason = None, {}, ""
+            self._metrics = self._checkpoints = None
+            self._last_write = time.monotonic()
+
+    def _merged_result(self, changes: dict):
+        """SQL expression setting the top-level `changes` keys of the stored result, keeping the others"""
+        dialect = self._session.bind.dialect.name
+        if dialect == "postgresql":
+            merged = func.coalesce(cast(Task.result, JSONB), text("'{}'::jsonb")).op("||")(
+                cast(literal(json.dumps(changes, ensure_ascii=False)), JSONB)
+            )
+            return cast(merged, JSON)
+        if dialect in ("sqlite", "mysql"):
+            args = []
+            for key, value in changes.items():
+                args.append(f'$."{key}"')
+                value = json.dumps(value, ensure_ascii=False)
+                args.append(func.json(value) if dialect == "sqlite" else cast(literal(value), JSON))
+            empty = "{}" if dialect == "sqlite" else func.json_object()
+            return func.json_set(func.coalesce(Task.result, empty), *args)
+
+        task = self._session.get(Task, self.task_id)
+        return {**((task.result if task else None) or {}), **changes}
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
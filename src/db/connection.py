@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from loguru import logger
+from sqlalchemy import create_engine, inspect, literal
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -27,5 +28,39 @@ def get_db():
         db.close()
 
 
-def create_tables():
-    Base.metadata.create_all(engine)
\ No newline at end of file
+def create_tables(bind=None):
+    """Create missing tables, then bring existing ones up to date with the models.
+
+    There are no migrations: columns added to a model are added to its existing table, with the
+    column's scalar default for existing rows, before the indexes that may cover them are created.
+    """
+    from src.db import models  # noqa: F401, registers the tables on Base
+
+    bind = bind or engine
+    Base.metadata.create_all(bind)
+    with bind.begin() as conn:
+        _add_missing_columns(conn)
+    # create_all skips indexes of tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+
+def _add_missing_columns(conn):
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.quote(column.name)} " \
+                  f"{column.type.compile(dialect=conn.dialect)}"
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if isinstance(default, (str, int, float, bool)):
+                value = literal(default, column.type).compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+                ddl += f" DEFAULT {value}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            logger.info(f"adding column {table.name}.{column.name}")
+            conn.exec_driver_sql(ddl)
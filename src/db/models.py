@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum, Text, DateTime, JSON, UniqueConstraint, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, Text, DateTime, JSON, UniqueConstraint, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID
 from uuid6 import uuid7
-from src.constants.enums import TaskStatus
+from src.constants.enums import TaskStatus, QueueLane
 from src.db.connection import Base
 from src.utils.date_utils import get_now
 
@@ -22,6 +22,12 @@ class Task(BaseModel):
     params = Column(JSON, default={})
     result = Column(JSON, default={})
     failed_reason = Column(Text, default="")
+    # per-stage wall/cpu time, peak rss, bytes downloaded and encode fps, see TaskService.start
+    metrics = Column(JSON, default={})
+    # outputs and artifact hashes of the finished stages, to resume a retry from, see StageCheckpoints
+    checkpoints = Column(JSON, default={})
+    # hash of stop_at and the params that affect the output, identical requests reuse the task, see TaskCrud.add_task
+    fingerprint = Column(String(64), nullable=True, index=True)
 
 
 class Clip(BaseModel):
@@ -61,9 +67,52 @@ class TaskQueue(BaseModel):
 
     task_id = Column(UUID(as_uuid=True), ForeignKey("tasks.id"), nullable=False, unique=True)
     message = Column(JSON, nullable=False)
+    lane = Column(String(20), default=QueueLane.RENDER.value, nullable=False)
     processed = Column(Boolean, default=False, nullable=False)
     processing_started_at = Column(DateTime(timezone=True), nullable=True)
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
     processed_at = Column(DateTime(timezone=True), nullable=True)
     retry_count = Column(Integer, default=0, nullable=False)
     max_retries = Column(Integer, default=3, nullable=False)
+    # failed messages are retried with backoff, not claimable before this
+    visible_after = Column(DateTime(timezone=True), nullable=True)
+
+    # partial indexes only cover pending rows, so claims and reaping don't slow down as history grows
+    __table_args__ = (
+        Index(
+            "ix_task_queue_claim", "lane", "created_at",
+            postgresql_where=processed == False, sqlite_where=processed == False,
+        ),
+        Index(
+            "ix_task_queue_lease", "lease_expires_at",
+            postgresql_where=lease_owner.isnot(None), sqlite_where=lease_owner.isnot(None),
+        ),
+    )
+
+
+class TaskQueueArchive(BaseModel):
+    """Processed and failed queue messages, moved out of task_queue by QueueService.archive_processed"""
+    __tablename__ = "task_queue_archive"
+
+    task_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    message = Column(JSON, nullable=False)
+    lane = Column(String(20), nullable=False)
+    processing_started_at = Column(DateTime(timezone=True), nullable=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    retry_count = Column(Integer, default=0, nullable=False)
+    max_retries = Column(Integer, default=3, nullable=False)
+    archived_at = Column(DateTime(timezone=True), default=get_now)
 
+
+
+class TaskDeadLetter(BaseModel):
+    """Queue messages that used up their retries, with the error that failed them last"""
+    __tablename__ = "task_dead_letters"
+
+    task_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    message = Column(JSON, nullable=False)
+    lane = Column(String(20), nullable=False)
+    retry_count = Column(Integer, default=0, nullable=False)
+    stage = Column(String(30), nullable=False, default="")
+    last_error = Column(Text, default="")
@@ -17,6 +17,7 @@ from src.db.connection import engine, create_tables
 from src.models.exception import HttpException
 from src.utils import utils
 from src.constants.config import env
+from src.services.voice_catalog import voice_catalog
 from src.worker.task_worker import consume_messages
 
 stop_event = asyncio.Event()
@@ -25,15 +26,20 @@ background_tasks: List[asyncio.Task] = []
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_tables()
-    background_tasks.append(asyncio.create_task(consume_messages()))
+    voice_catalog.start()
+    if env.WORKER.embedded:
+        stop_event.clear()
+        background_tasks.append(asyncio.create_task(consume_messages(stop_event)))
     logger.info("started lifespan")
 
     yield
 
-    for task in background_tasks:
-        task.cancel()
+    # the consumer drains like the standalone worker: running tasks stop after their current stage,
+    # finished ones are acknowledged and the rest released
+    stop_event.set()
     if background_tasks:
         await asyncio.gather(*background_tasks, return_exceptions=True)
+        background_tasks.clear()
 
     engine.dispose()
     logger.info("ended lifespan")
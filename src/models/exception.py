@@ -26,3 +26,25 @@ class HttpException(Exception):
 
 class FileNotFoundException(Exception):
     pass
+
+
+class TaskInterrupted(Exception):
+    """Raised between stages when the worker running a task is asked to stop"""
+    pass
+
+
+class TaskCancelled(TaskInterrupted):
+    """Raised inside a running task once it has been cancelled (deleted)"""
+    pass
+
+
+class TaskStageError(Exception):
+    """Raised when a stage of the task pipeline fails unexpectedly, naming the stage"""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(stage, message)
+        self.stage = stage
+        self.message = message
+
+    def __str__(self):
+        return f"{self.stage}: {self.message}"
@@ -79,6 +79,9 @@ class AudioRequest(BaseModel):
     voice_acceleration: Optional[str] = "+0%"
     bgm_file: Optional[str] = "random"
     bgm_volume: Optional[float] = 0.2
+    # return the task of an identical earlier request instead of rendering again,
+    # False to always get a new task, e.g. for another random variant
+    reuse_existing: bool = True
 
 
 class SubtitleRequest(AudioRequest):
@@ -211,10 +214,13 @@ class TaskLiteOut(BaseModel):
 class TaskOut(TaskLiteOut):
     result: Optional[dict] = None
     failed_reason: Optional[str] = None
+    metrics: Optional[dict] = None
 
 
 class TaskIdOut(BaseModel):
     task_id: str
+    # the task of an identical earlier request was returned
+    reused: bool = False
 
 
 class TaskStatusOut(BaseModel):
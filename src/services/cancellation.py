@@ -0,0 +1,105 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from loguru import logger
+from proglog import ProgressBarLogger
+
+from src.constants.enums import TaskStatus
+from src.models.exception import TaskCancelled
+from src.utils.utils import to_uuid
+
+
+# when the task running in this process last reached a cancellation check, i.e. last made progress
+_last_progress = time.monotonic()
+
+
+def report_progress():
+    global _last_progress
+    _last_progress = time.monotonic()
+
+
+def seconds_since_progress() -> float:
+    """Seconds since the task running in this process last made progress, see LeaseHeartbeat"""
+    return time.monotonic() - _last_progress
+
+
+class CancellationToken:
+    """Tells a running task that it was cancelled, i.e. deleted or marked CANCELLED.
+
+    The database is asked at most once per `interval` seconds, so the token can be checked
+    from tight loops (every downloaded clip, transcribed segment or encoded frame).
+    """
+
+    def __init__(self, task_id: str, interval: float = 2.0):
+        self.task_id = to_uuid(task_id)
+        self.interval = interval
+        self._cancelled = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _query(self) -> bool:
+        # imported here so that services checking for cancellation don't need a database to import
+        from src.db.connection import SessionLocal
+        from src.db.models import Task
+
+        with SessionLocal() as session:
+            status = session.query(Task.status).filter(Task.id == self.task_id).scalar()
+        return status is None or status == TaskStatus.CANCELLED.value
+
+    def is_cancelled(self) -> bool:
+        with self._lock:
+            if self._cancelled or time.monotonic() - self._checked_at < self.interval:
+                return self._cancelled
+            self._checked_at = time.monotonic()
+            try:
+                self._cancelled = self._query()
+            except Exception as e:
+                logger.warning(f"failed to check cancellation of task {self.task_id}: {e}")
+            return self._cancelled
+
+    def check(self):
+        report_progress()
+        if self.is_cancelled():
+            logger.warning(f"task {self.task_id} cancelled")
+            raise TaskCancelled(str(self.task_id))
+
+
+# token of the task running in the current context, see cancellable()
+_current: ContextVar[Optional[CancellationToken]] = ContextVar("cancellation_token", default=None)
+
+
+@contextmanager
+def cancellable(token: CancellationToken):
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def check():
+    """Raise TaskCancelled if the task running in this context was cancelled; also a sign of progress"""
+    report_progress()
+    token = _current.get()
+    if token:
+        token.check()
+
+
+class CancellableProgressLogger(ProgressBarLogger):
+    """Progress logger for moviepy that aborts the frame loop, and so ffmpeg, once the task is cancelled"""
+
+    def __init__(self, token: CancellationToken):
+        super().__init__()
+        self.token = token
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        self.token.check()
+
+
+def progress_logger() -> Optional[ProgressBarLogger]:
+    """Logger to pass to moviepy's write_* calls: None (silent) outside of a cancellable task"""
+    token = _current.get()
+    return CancellableProgressLogger(token) if token else None
@@ -0,0 +1,58 @@
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+
+from src.constants.enums import StopAt
+from src.utils.file_utils import file_sha256
+
+
+class StageCheckpoints:
+    """Outputs of the finished stages of a task, with hashes of the files they produced.
+
+    Stored in `task.checkpoints`, not in the result returned by the api. A retry resumes a stage when its checkpoint still
+    matches the files on disk and every stage it depends on was resumed as well; a stage that
+    runs again invalidates the checkpoints of the stages built on it.
+    """
+
+    def __init__(self, checkpoints: Dict[str, dict] = None):
+        self.data: Dict[str, dict] = dict(checkpoints or {})
+        self._resumed: List[str] = []
+
+    @staticmethod
+    def _is_intact(checkpoint: dict) -> bool:
+        for file, digest in checkpoint.get("artifacts", {}).items():
+            try:
+                if file_sha256(file) != digest:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _invalidate(self, name: str):
+        self.data.pop(name, None)
+        for other, checkpoint in list(self.data.items()):
+            if name in checkpoint.get("depends_on", []):
+                self._invalidate(other)
+
+    def resume(self, stage: StopAt, depends_on: Iterable[StopAt] = ()) -> Optional[dict]:
+        """Output of `stage` from an earlier run, or None if the stage has to run"""
+        checkpoint = self.data.get(stage.value)
+        if (checkpoint and all(dep.value in self._resumed for dep in depends_on)
+                and self._is_intact(checkpoint)):
+            self._resumed.append(stage.value)
+            logger.info(f"resuming stage {stage} from checkpoint")
+            return checkpoint["output"]
+
+        self._invalidate(stage.value)
+        return None
+
+    def save(self, stage: StopAt, output: dict, artifacts: List[str] = None,
+             depends_on: Iterable[StopAt] = ()) -> Dict[str, dict]:
+        """Record `stage` as finished; returns all checkpoints, to be stored with the task result"""
+        self._invalidate(stage.value)
+        self.data[stage.value] = {
+            "output": output,
+            "artifacts": {file: file_sha256(file) for file in artifacts or [] if file},
+            "depends_on": [dep.value for dep in depends_on],
+        }
+        return self.data
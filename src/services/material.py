@@ -1,6 +1,9 @@
 import os
 import random
-from typing import List
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Callable, Deque, List, Optional, Tuple
 from urllib.parse import urlencode
 
 import requests
@@ -8,8 +11,10 @@ from loguru import logger
 from moviepy.video.io.VideoFileClip import VideoFileClip
 
 from src.constants.config import env
+from src.models.exception import TaskInterrupted
 from src.models.schema import MaterialInfo, VideoAspect, VideoConcatMode
-from src.utils import utils
+from src.services import cancellation
+from src.utils import file_utils, http_utils, metrics, utils, video_probe
 
 requested_count = 0
 
@@ -34,10 +39,10 @@ def search_videos_pexels(
     logger.info(f"searching videos: {query_url}, with proxies: {env.CLIP.proxy}")
 
     try:
-        r = requests.get(
+        r = http_utils.get(
             query_url,
             headers=headers,
-            proxies=env.CLIP.proxy,
+            proxy=env.CLIP.proxy,
             verify=False,
             timeout=(30, 60),
         )
@@ -92,8 +97,8 @@ def search_videos_pixabay(
     logger.info(f"searching videos: {query_url}, with proxies: {env.CLIP.proxy}")
 
     try:
-        r = requests.get(
-            query_url, proxies=env.CLIP.proxy, verify=False, timeout=(30, 60)
+        r = http_utils.get(
+            query_url, proxy=env.CLIP.proxy, verify=False, timeout=(30, 60)
         )
         response = r.json()
         video_items = []
@@ -127,6 +132,9 @@ def search_videos_pixabay(
     return []
 
 
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+
+
 def save_video(video_url: str, save_dir: str = "") -> str:
     if not save_dir:
         save_dir = utils.storage_dir("cache_videos")
@@ -142,39 +150,177 @@ def save_video(video_url: str, save_dir: str = "") -> str:
     # if video already exists, return the path
     if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
         logger.info(f"video already exists: {video_path}")
+        file_utils.touch(video_path)
         return video_path
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
-    }
+    # tasks picking the same clip download it once, the others wait and reuse it
+    with file_utils.file_lock(f"{video_path}.lock", on_wait=cancellation.check):
+        if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
+            logger.info(f"video downloaded meanwhile: {video_path}")
+            file_utils.touch(video_path)
+            return video_path
+        return _download_video(video_url, video_path)
 
-    # if video does not exist, download it
-    with open(video_path, "wb") as f:
-        f.write(
-            requests.get(
-                video_url,
-                headers=headers,
-                proxies=env.CLIP.proxy,
-                verify=False,
-                timeout=(60, 240),
-            ).content
-        )
 
-    if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
+def _download_video(video_url: str, video_path: str) -> str:
+    """Download into a part file, check it is a playable video and publish it as `video_path` with its info"""
+    part_path = f"{video_path}.part"
+    try:
+        _download_file(video_url, part_path)
+    except TaskInterrupted:
+        raise
+    except Exception as e:
+        # the partial file is resumed by the next attempt, or removed by the storage janitor
+        logger.warning(f"failed to download video: {video_url} => {str(e)}")
+        return ""
+
+    info = video_probe.probe(part_path)
+    if info is None or not info.valid:
+        info = _probe_with_moviepy(part_path) or info
+    if info is not None and info.valid:
+        # readers never see a partial file under the final name
+        os.replace(part_path, video_path)
+        video_probe.save_info(video_path, info)
+        return video_path
+    logger.warning(f"invalid video file: {video_url} => {info}")
+    try:
+        os.remove(part_path)
+    except OSError:
+        pass
+    return ""
+
+
+def _probe_with_moviepy(path: str) -> Optional[video_probe.VideoInfo]:
+    """Fallback for files that neither the header parser nor ffprobe could read; starts a decoder"""
+    try:
+        clip = VideoFileClip(path)
+        info = video_probe.VideoInfo(duration=clip.duration or 0, fps=clip.fps or 0, width=clip.size[0], height=clip.size[1])
+        clip.close()
+        return info
+    except Exception as e:
+        logger.warning(f"failed to open video: {path} => {str(e)}")
+        return None
+
+
+def _download_file(url: str, path: str, attempts: int = None, chunk_size: int = 1024 * 1024) -> int:
+    """Stream `url` into `path` chunk by chunk, resuming what is already there with a Range request.
+
+    Interrupted transfers are resumed up to `attempts` times; the size is checked against the one announced
+    by the server. Returns the size of the file.
+    """
+    attempts = attempts or env.CLIP.download_attempts
+    for attempt in range(1, attempts + 1):
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        headers = {"User-Agent": USER_AGENT}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
         try:
-            clip = VideoFileClip(video_path)
-            duration = clip.duration
-            fps = clip.fps
-            clip.close()
-            if duration > 0 and fps > 0:
-                return video_path
-        except Exception as e:
+            with http_utils.get(
+                url, headers=headers, proxy=env.CLIP.proxy, verify=False, timeout=(60, 240), stream=True,
+            ) as response:
+                if response.status_code == 416 and offset:
+                    # already complete, unless the server lost track of the file; then the check below fails
+                    total = _content_range_total(response.headers.get("Content-Range"))
+                    if total == offset:
+                        return offset
+                    os.remove(path)
+                    continue
+                response.raise_for_status()
+
+                if response.status_code == 206 and offset:
+                    total = _content_range_total(response.headers.get("Content-Range"))
+                    mode = "ab"
+                else:
+                    # the server ignored the range, start over
+                    offset = 0
+                    length = response.headers.get("Content-Length")
+                    total = int(length) if length and length.isdigit() else None
+                    mode = "wb"
+
+                with open(path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        cancellation.check()
+                        f.write(chunk)
+                        metrics.add("bytes_downloaded", len(chunk))
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == attempts:
+                raise
+            logger.warning(f"download interrupted, resuming: {url}, attempt {attempt}/{attempts} => {str(e)}")
+            continue
+
+        size = os.path.getsize(path)
+        if total is None or size == total:
+            return size
+        if attempt == attempts:
+            raise IOError(f"incomplete download: {size} of {total} bytes")
+        logger.warning(f"incomplete download, resuming: {url}, {size} of {total} bytes")
+
+    raise IOError(f"failed to download {url}")
+
+
+def _content_range_total(content_range: Optional[str]) -> Optional[int]:
+    """Total size from a `bytes 0-99/1000` or `bytes */1000` Content-Range header"""
+    total = (content_range or "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+class _ClipDownloader:
+    """Downloads clips in the order of `items`, keeping up to `concurrency` downloads in flight.
+
+    Results are taken in that order too, so the clips chosen don't depend on which download finishes
+    first. Downloads still in flight once enough duration is reached are kept for a later top-up.
+    """
+
+    def __init__(self, items: List[MaterialInfo], save_dir: str, max_clip_duration: int, concurrency: int):
+        self.items = iter(items)
+        self.save_dir = save_dir
+        self.max_clip_duration = max_clip_duration
+        self.concurrency = max(concurrency, 1)
+        self.downloaded: List[Tuple[str, float]] = []
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="clip-download")
+        self._pending: Deque[Tuple[MaterialInfo, Future]] = deque()
+
+    def _download(self, item: MaterialInfo) -> str:
+        logger.info(f"downloading video: {item.url}")
+        return save_video(video_url=item.url, save_dir=self.save_dir)
+
+    def _schedule(self):
+        while len(self._pending) < self.concurrency:
+            item = next(self.items, None)
+            if item is None:
+                return
+            # downloads count towards the stage's metrics and see its cancellation
+            context = copy_context()
+            self._pending.append((item, self._executor.submit(context.run, self._download, item)))
+
+    def until(self, required_duration: float):
+        """Download clips until their duration exceeds `required_duration`"""
+        total_duration = sum(seconds for _, seconds in self.downloaded)
+        while total_duration <= required_duration:
+            cancellation.check()
+            self._schedule()
+            if not self._pending:
+                return
+
+            item, future = self._pending.popleft()
             try:
-                os.remove(video_path)
-            except Exception:
-                pass
-            logger.warning(f"invalid video file: {video_path} => {str(e)}")
-    return ""
+                saved_video_path = future.result()
+            except TaskInterrupted:
+                raise
+            except Exception as e:
+                logger.error(f"failed to download video: {utils.to_json(item)} => {str(e)}")
+                continue
+            if saved_video_path:
+                logger.info(f"video saved: {saved_video_path}")
+                seconds = min(self.max_clip_duration, item.duration)
+                self.downloaded.append((saved_video_path, seconds))
+                total_duration += seconds
+
+        logger.info(f"total duration of downloaded videos: {total_duration} seconds, skip downloading more")
+
+    def close(self):
+        """Drop downloads that haven't started; running ones finish into the cache"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 
 def download_videos(
@@ -185,7 +331,16 @@ def download_videos(
     video_contact_mode: VideoConcatMode = VideoConcatMode.random,
     audio_duration: float = 0.0,
     max_clip_duration: int = 5,
+    final_duration: Callable[[], Optional[float]] = None,
+    concurrency: int = None,
 ) -> List[str]:
+    """
+    Download clips covering `audio_duration` seconds.
+
+    With `final_duration`, `audio_duration` is only an estimate: clips are fetched for it right away,
+    then topped up or trimmed to the duration `final_duration` blocks for (None gives up).
+    Up to `concurrency` clips are downloaded at a time, CLIP_DOWNLOAD_CONCURRENCY by default.
+    """
     valid_video_items = []
     valid_video_urls = []
     found_duration = 0.0
@@ -210,7 +365,6 @@ def download_videos(
     logger.info(
         f"found total videos: {len(valid_video_items)}, required duration: {audio_duration} seconds, found duration: {found_duration} seconds"
     )
-    video_paths = []
 
     material_directory = env.DIR.clips.as_posix()
     if material_directory == "task":
@@ -221,25 +375,32 @@ def download_videos(
     if video_contact_mode.value == VideoConcatMode.random.value:
         random.shuffle(valid_video_items)
 
-    total_duration = 0.0
-    for item in valid_video_items:
-        try:
-            logger.info(f"downloading video: {item.url}")
-            saved_video_path = save_video(
-                video_url=item.url, save_dir=material_directory
-            )
-            if saved_video_path:
-                logger.info(f"video saved: {saved_video_path}")
-                video_paths.append(saved_video_path)
-                seconds = min(max_clip_duration, item.duration)
+    downloader = _ClipDownloader(
+        valid_video_items, material_directory, max_clip_duration,
+        concurrency if concurrency is not None else env.CLIP.download_concurrency,
+    )
+    try:
+        downloader.until(audio_duration)
+        downloaded = downloader.downloaded
+
+        if final_duration:
+            estimated_duration, audio_duration = audio_duration, final_duration()
+            if audio_duration is None:
+                return []
+            logger.info(f"required duration: {audio_duration} seconds, estimated: {estimated_duration} seconds")
+            downloader.until(audio_duration)
+
+            # clips fetched for an overestimate stay in the cache, but are not used
+            total_duration = 0.0
+            for count, (_, seconds) in enumerate(downloaded, start=1):
                 total_duration += seconds
                 if total_duration > audio_duration:
-                    logger.info(
-                        f"total duration of downloaded videos: {total_duration} seconds, skip downloading more"
-                    )
+                    downloaded = downloaded[:count]
                     break
-        except Exception as e:
-            logger.error(f"failed to download video: {utils.to_json(item)} => {str(e)}")
+    finally:
+        downloader.close()
+
+    video_paths = [video_path for video_path, _ in downloaded]
     logger.success(f"downloaded {len(video_paths)} videos")
     return video_paths
 
@@ -0,0 +1,86 @@
+import select
+import threading
+import time
+from typing import Callable, List, Optional
+
+from loguru import logger
+
+from src.db.connection import engine
+
+
+def channel_name(queue_name: str) -> str:
+    return f"queue_{queue_name}"
+
+
+class QueueNotifier:
+    """Wakes idle consumers when a message is sent.
+
+    Subscribers in the sending process are called directly; on PostgreSQL, other
+    processes are reached through LISTEN/NOTIFY on a dedicated connection.
+    """
+
+    def __init__(self):
+        self._subscribers: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    def subscribe(self, callback: Callable[[], None]):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def notify_local(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"queue subscriber failed: {e}")
+
+    def listen(self, queue_name: str):
+        """Start relaying PostgreSQL notifications for `queue_name` to local subscribers"""
+        if self._listener or engine.dialect.name != "postgresql":
+            return
+
+        self._listener = threading.Thread(
+            target=self._listen, args=(channel_name(queue_name),), name="queue-listener", daemon=True
+        )
+        self._listener.start()
+
+    def _listen(self, channel: str):
+        while True:
+            connection = None
+            try:
+                # detached from the pool: this connection is held for the lifetime of the process
+                connection = engine.raw_connection()
+                connection.detach()
+                dbapi_connection = connection.driver_connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{channel}"')
+                logger.info(f"listening on queue channel: {channel}")
+
+                while True:
+                    if select.select([dbapi_connection], [], [], 60) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    if dbapi_connection.notifies:
+                        dbapi_connection.notifies.clear()
+                        self.notify_local()
+            except Exception as e:
+                logger.error(f"queue listener failed, reconnecting: {e}")
+                time.sleep(5)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+
+queue_notifier = QueueNotifier()
@@ -1,39 +1,108 @@
-from typing import Dict, Any, Optional
-from datetime import datetime
+import os
+import random
+import socket
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import DateTime, and_, delete, insert, literal, or_, select, text, update
 from loguru import logger
 from uuid6 import uuid7
 
+from src.constants.config import env
+from src.constants.enums import QueueLane, TaskStatus
 from src.db.connection import SessionLocal
-from src.db.models import TaskQueue
+from src.db.models import Task, TaskDeadLetter, TaskQueue, TaskQueueArchive
+from src.services.queue_notifier import channel_name, queue_notifier
 from src.utils.date_utils import get_now
+from src.utils.utils import to_uuid
+
+def default_worker_id() -> str:
+    return env.WORKER.id or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def retry_delay(attempt: int) -> float:
+    """Seconds to hold back a message after its `attempt`-th failure: exponential, with equal jitter"""
+    delay = min(env.WORKER.retry_base_seconds * 2 ** max(attempt - 1, 0), env.WORKER.retry_max_seconds)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _fail_attempt(db: Session, queue_item: TaskQueue, error: str, stage: str = ""):
+    """Count a failed attempt; hold the message back for a while, or dead-letter it when out of retries"""
+    status = db.query(Task.status).filter(Task.id == queue_item.task_id).scalar()
+    if status == TaskStatus.CANCELLED.value:
+        # cancelled while its worker died or failed: nothing to retry or report, purge it like process_task does
+        task_id = queue_item.task_id
+        db.delete(queue_item)
+        db.flush()
+        db.query(Task).filter(Task.id == task_id).delete(synchronize_session=False)
+        logger.info(f"Purged message {queue_item.id} of cancelled task {task_id}")
+        return
+
+    now = get_now()
+    queue_item.retry_count += 1
+    queue_item.processing_started_at = None
+    queue_item.lease_owner = None
+    queue_item.lease_expires_at = None
+
+    if queue_item.retry_count < queue_item.max_retries:
+        delay = retry_delay(queue_item.retry_count)
+        queue_item.visible_after = now + timedelta(seconds=delay)
+        logger.info(f"Message {queue_item.id} will be retried in {delay:.0f}s (attempt {queue_item.retry_count})")
+        return
+
+    queue_item.processed = True
+    queue_item.processed_at = now
+    db.add(TaskDeadLetter(
+        task_id=queue_item.task_id,
+        message=queue_item.message,
+        lane=queue_item.lane,
+        retry_count=queue_item.retry_count,
+        stage=stage,
+        last_error=error,
+    ))
+    db.query(Task).filter(Task.id == queue_item.task_id, Task.status != TaskStatus.CANCELLED.value).update(
+        {Task.status: TaskStatus.FAILED.value, Task.failed_reason: error},
+        synchronize_session=False,
+    )
+    logger.warning(f"Message exceeded max retries, moved to dead letters: {queue_item.id}")
 
 
 class QueueService:
     """Database-based queue service to replace pgmq functionality"""
     
     @staticmethod
-    def send(queue_name: str, message: Dict[str, Any]) -> str:
+    def enqueue(db: Session, queue_name: str, message: Dict[str, Any], lane: QueueLane = QueueLane.RENDER) -> TaskQueue:
+        """Add a message within the caller's transaction; call queue_notifier.notify_local() after committing"""
+        task_id = message.get("task_id")
+        if not task_id:
+            raise ValueError("Message must contain 'task_id'")
+
+        queue_item = TaskQueue(
+            task_id=to_uuid(task_id),
+            message=message,
+            lane=lane.value,
+            processed=False,
+            retry_count=0
+        )
+
+        db.add(queue_item)
+        if db.bind.dialect.name == "postgresql":
+            # delivered to listeners when the transaction commits
+            db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                       {"channel": channel_name(queue_name), "payload": str(task_id)})
+        return queue_item
+
+    @staticmethod
+    def send(queue_name: str, message: Dict[str, Any], lane: QueueLane = QueueLane.RENDER) -> str:
         """Add a message to the queue"""
         db: Session = SessionLocal()
         try:
-            task_id = message.get("task_id")
-            if not task_id:
-                raise ValueError("Message must contain 'task_id'")
-            
-            queue_item = TaskQueue(
-                task_id=task_id,
-                message=message,
-                processed=False,
-                retry_count=0
-            )
-            
-            db.add(queue_item)
+            queue_item = QueueService.enqueue(db, queue_name, message, lane)
             db.commit()
             db.refresh(queue_item)
-            
-            logger.info(f"Added message to queue: {queue_item.id} for task: {task_id}")
+            queue_notifier.notify_local()
+
+            logger.info(f"Added message to queue: {queue_item.id} for task: {message['task_id']}")
             return str(queue_item.id)
             
         except Exception as e:
@@ -44,53 +113,166 @@ class QueueService:
             db.close()
     
     @staticmethod
-    def read(queue_name: str) -> Optional['QueueMessage']:
-        """Read and lock the next unprocessed message from the queue"""
+    def read(queue_name: str, worker_id: str = None, lanes: List[QueueLane] = None) -> Optional['QueueMessage']:
+        """Atomically claim the next unprocessed message of `lanes` (all lanes if omitted) and lease it to `worker_id`"""
+        messages = QueueService.read_batch(queue_name, 1, worker_id, lanes)
+        return messages[0] if messages else None
+
+    @staticmethod
+    def read_batch(queue_name: str, limit: int, worker_id: str = None, lanes: List[QueueLane] = None) -> List['QueueMessage']:
+        """Atomically claim up to `limit` of the oldest unprocessed messages and lease them to `worker_id`"""
+        if limit <= 0:
+            return []
+
+        worker_id = worker_id or default_worker_id()
         db: Session = SessionLocal()
         try:
-            # Get the oldest unprocessed message
-            queue_item = db.query(TaskQueue).filter(
+            now = get_now()
+            expires_at = now + timedelta(seconds=env.WORKER.lease_seconds)
+            candidates = select(TaskQueue.id).where(
                 and_(
                     TaskQueue.processed == False,
-                    TaskQueue.retry_count < TaskQueue.max_retries
+                    TaskQueue.retry_count < TaskQueue.max_retries,
+                    TaskQueue.lease_owner.is_(None),
+                    or_(TaskQueue.visible_after.is_(None), TaskQueue.visible_after <= now),
                 )
-            ).order_by(TaskQueue.created_at.asc()).first()
-            
-            if queue_item:
-                # Mark as being processed
-                queue_item.processing_started_at = get_now()
+            )
+            if lanes:
+                candidates = candidates.where(TaskQueue.lane.in_([lane.value for lane in lanes]))
+            # rows locked by other workers are skipped instead of waited on (postgresql, mysql)
+            candidates = candidates.order_by(TaskQueue.created_at.asc()).limit(limit).with_for_update(skip_locked=True)
+
+            lease = {
+                TaskQueue.lease_owner: worker_id,
+                TaskQueue.lease_expires_at: expires_at,
+                TaskQueue.processing_started_at: now,
+            }
+
+            if db.bind.dialect.update_returning:
+                # one round trip; sqlite runs the whole statement under its single writer lock
+                queue_items = db.scalars(
+                    update(TaskQueue)
+                    .where(TaskQueue.id.in_(candidates.scalar_subquery()))
+                    .values(lease)
+                    .returning(TaskQueue)
+                    .execution_options(synchronize_session=False)
+                ).all()
+                db.commit()
+            else:
+                # e.g. mysql: lock the candidates, then claim them with a compare-and-set update
+                ids = db.scalars(candidates).all()
+                queue_items = []
+                if ids:
+                    db.execute(
+                        update(TaskQueue)
+                        .where(TaskQueue.id.in_(ids), TaskQueue.lease_owner.is_(None))
+                        .values(lease)
+                        .execution_options(synchronize_session=False)
+                    )
+                    # still locked by this transaction; not matched on lease_expires_at, which
+                    # mysql stores without fractional seconds
+                    queue_items = db.query(TaskQueue).filter(
+                        TaskQueue.id.in_(ids),
+                        TaskQueue.lease_owner == worker_id,
+                    ).all()
                 db.commit()
-                
-                return QueueMessage(
+
+            return [
+                QueueMessage(
                     msg_id=str(queue_item.id),
                     message=queue_item.message,
-                    retry_count=queue_item.retry_count
+                    retry_count=queue_item.retry_count,
+                    lease_owner=worker_id,
+                    lane=QueueLane(queue_item.lane),
                 )
-                
-            return None
-            
+                for queue_item in sorted(queue_items, key=lambda item: item.created_at)
+            ]
+
         except Exception as e:
             db.rollback()
-            logger.error(f"Failed to read message from queue: {e}")
-            return None
+            logger.error(f"Failed to read messages from queue: {e}")
+            return []
         finally:
             db.close()
-    
+
     @staticmethod
-    def delete(queue_name: str, msg_id: str) -> bool:
+    def heartbeat(queue_name: str, msg_id: str, worker_id: str) -> bool:
+        """Extend the lease on a message; False if the lease was lost to the reaper"""
+        db: Session = SessionLocal()
+        try:
+            extended = db.query(TaskQueue).filter(
+                TaskQueue.id == to_uuid(msg_id),
+                TaskQueue.lease_owner == worker_id,
+            ).update(
+                {TaskQueue.lease_expires_at: get_now() + timedelta(seconds=env.WORKER.lease_seconds)},
+                synchronize_session=False,
+            )
+            db.commit()
+            return extended > 0
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to extend lease of message {msg_id}: {e}")
+            return True
+        finally:
+            db.close()
+
+    @staticmethod
+    def reap_expired(queue_name: str) -> int:
+        """Re-queue messages whose lease expired (crashed worker), counting it as a failed attempt"""
+        db: Session = SessionLocal()
+        try:
+            query = db.query(TaskQueue).filter(
+                and_(
+                    TaskQueue.processed == False,
+                    TaskQueue.lease_owner.isnot(None),
+                    TaskQueue.lease_expires_at < get_now(),
+                )
+            )
+            if db.bind.dialect.name in ("postgresql", "mysql"):
+                query = query.with_for_update(skip_locked=True)
+
+            expired = query.all()
+            for queue_item in expired:
+                logger.warning(f"Lease of message {queue_item.id} held by {queue_item.lease_owner} expired")
+                _fail_attempt(db, queue_item, f"lease held by {queue_item.lease_owner} expired")
+
+            db.commit()
+            return len(expired)
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to reap expired messages: {e}")
+            return 0
+        finally:
+            db.close()
+
+    @staticmethod
+    def _leased(db: Session, msg_id: str, worker_id: str) -> Optional[TaskQueue]:
+        """The message if `worker_id` still holds its lease; a reaped one may be running on another worker"""
+        return db.query(TaskQueue).filter(
+            TaskQueue.id == to_uuid(msg_id),
+            TaskQueue.lease_owner == worker_id,
+            TaskQueue.processed == False,
+        ).first()
+
+    @staticmethod
+    def delete(queue_name: str, msg_id: str, worker_id: str) -> bool:
         """Mark a message as processed (successful completion)"""
         db: Session = SessionLocal()
         try:
-            queue_item = db.query(TaskQueue).filter(TaskQueue.id == msg_id).first()
+            queue_item = QueueService._leased(db, msg_id, worker_id)
             
             if queue_item:
                 queue_item.processed = True
                 queue_item.processed_at = get_now()
+                queue_item.lease_owner = None
+                queue_item.lease_expires_at = None
                 db.commit()
                 logger.info(f"Marked message as processed: {msg_id}")
                 return True
             
-            logger.warning(f"Message not found for deletion: {msg_id}")
+            logger.warning(f"Message not found or lease lost, not marked processed: {msg_id}")
             return False
             
         except Exception as e:
@@ -101,27 +283,83 @@ class QueueService:
             db.close()
     
     @staticmethod
-    def retry_message(queue_name: str, msg_id: str) -> bool:
-        """Mark a message for retry (failed processing)"""
+    def delete_batch(queue_name: str, msg_ids: List[str], worker_id: str) -> int:
+        """Mark several messages leased by `worker_id` as processed in one statement"""
+        if not msg_ids:
+            return 0
+
         db: Session = SessionLocal()
         try:
-            queue_item = db.query(TaskQueue).filter(TaskQueue.id == msg_id).first()
+            now = get_now()
+            processed = db.query(TaskQueue).filter(
+                TaskQueue.id.in_([to_uuid(msg_id) for msg_id in msg_ids]),
+                TaskQueue.lease_owner == worker_id,
+                TaskQueue.processed == False,
+            ).update(
+                {
+                    TaskQueue.processed: True,
+                    TaskQueue.processed_at: now,
+                    TaskQueue.lease_owner: None,
+                    TaskQueue.lease_expires_at: None,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            logger.info(f"Marked {processed} messages as processed")
+            if processed < len(msg_ids):
+                logger.warning(f"{len(msg_ids) - processed} messages lost their lease of {worker_id}, not marked processed")
+            return processed
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to delete messages from queue: {e}")
+            return 0
+        finally:
+            db.close()
+
+    @staticmethod
+    def release(queue_name: str, msg_id: str, worker_id: str) -> bool:
+        """Give up the lease on a message without counting an attempt (worker shutting down)"""
+        db: Session = SessionLocal()
+        try:
+            released = db.query(TaskQueue).filter(
+                TaskQueue.id == to_uuid(msg_id),
+                TaskQueue.lease_owner == worker_id,
+            ).update(
+                {
+                    TaskQueue.processing_started_at: None,
+                    TaskQueue.lease_owner: None,
+                    TaskQueue.lease_expires_at: None,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            if not released:
+                logger.warning(f"Message not found or lease lost, not released: {msg_id}")
+                return False
+            logger.info(f"Released message: {msg_id}")
+            return True
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to release message: {e}")
+            return False
+        finally:
+            db.close()
+
+    @staticmethod
+    def retry_message(queue_name: str, msg_id: str, worker_id: str, error: str = "", stage: str = "") -> bool:
+        """Mark a message for retry (failed processing); it becomes claimable again after a backoff"""
+        db: Session = SessionLocal()
+        try:
+            queue_item = QueueService._leased(db, msg_id, worker_id)
             
             if queue_item:
-                queue_item.retry_count += 1
-                queue_item.processing_started_at = None
-                
-                if queue_item.retry_count >= queue_item.max_retries:
-                    queue_item.processed = True
-                    queue_item.processed_at = get_now()
-                    logger.warning(f"Message exceeded max retries: {msg_id}")
-                else:
-                    logger.info(f"Message marked for retry: {msg_id} (attempt {queue_item.retry_count})")
-                
+                _fail_attempt(db, queue_item, error, stage)
                 db.commit()
                 return True
             
-            logger.warning(f"Message not found for retry: {msg_id}")
+            logger.warning(f"Message not found or lease lost, not retried: {msg_id}")
             return False
             
         except Exception as e:
@@ -133,10 +371,61 @@ class QueueService:
     
 
 
+    @staticmethod
+    def archive_processed(queue_name: str, older_than: timedelta, batch_size: int = 1000) -> int:
+        """Move messages processed before `older_than` ago to task_queue_archive, `batch_size` rows per transaction"""
+        archived = 0
+        columns = [
+            "id", "task_id", "message", "lane", "processing_started_at", "processed_at",
+            "retry_count", "max_retries", "created_at", "updated_at",
+        ]
+        while True:
+            db: Session = SessionLocal()
+            try:
+                now = get_now()
+                batch = select(TaskQueue.id).where(
+                    and_(
+                        TaskQueue.processed == True,
+                        TaskQueue.processed_at < now - older_than,
+                    )
+                ).limit(batch_size)
+                if db.bind.dialect.name in ("postgresql", "mysql"):
+                    batch = batch.with_for_update(skip_locked=True)
+
+                ids = db.scalars(batch).all()
+                if ids:
+                    db.execute(
+                        insert(TaskQueueArchive).from_select(
+                            columns + ["archived_at"],
+                            select(*[getattr(TaskQueue, column) for column in columns], literal(now, DateTime(timezone=True)))
+                            .where(TaskQueue.id.in_(ids)),
+                        )
+                    )
+                    db.execute(delete(TaskQueue).where(TaskQueue.id.in_(ids)))
+                db.commit()
+                archived += len(ids)
+                if len(ids) < batch_size:
+                    break
+
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Failed to archive processed messages: {e}")
+                break
+            finally:
+                db.close()
+
+        if archived:
+            logger.info(f"Archived {archived} processed messages")
+        return archived
+
+
 class QueueMessage:
     """Message object compatible with pgmq Message interface"""
     
-    def __init__(self, msg_id: str, message: Dict[str, Any], retry_count: int = 0):
+    def __init__(self, msg_id: str, message: Dict[str, Any], retry_count: int = 0, lease_owner: str = None,
+                 lane: QueueLane = QueueLane.RENDER):
         self.msg_id = msg_id
         self.message = message
         self.retry_count = retry_count
+        self.lease_owner = lease_owner
+        self.lane = lane
@@ -0,0 +1,124 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from src.constants.enums import StopAt
+from src.models.exception import TaskInterrupted, TaskStageError
+from src.services.checkpoint import StageCheckpoints
+
+
+@dataclass
+class Stage:
+    name: StopAt
+    # gets the outputs of the finished stages, returns this stage's output or None when it failed
+    run: Callable[[Dict[StopAt, dict]], Optional[dict]]
+    depends_on: Tuple[StopAt, ...] = ()
+    # stages whose output this one waits for itself, part-way through; they must run, but don't delay its start
+    awaits: Tuple[StopAt, ...] = ()
+    failed_reason: str = ""
+    # files written by the stage, hashed into its checkpoint
+    artifacts: Callable[[dict], List[str]] = field(default=lambda output: [])
+
+
+class StageGraph:
+    """Runs the stages of a task as soon as the stages they depend on have finished.
+
+    Independent stages (e.g. speech synthesis and LLM term generation) run at the same time,
+    so a task takes about as long as its slowest chain of stages instead of the sum of all.
+    """
+
+    def __init__(self, stages: List[Stage], max_workers: int = 3):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max(max_workers, 1)
+
+    def required(self, targets: List[StopAt]) -> Set[StopAt]:
+        """`targets` and everything they depend on"""
+        required, pending = set(), list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in required:
+                required.add(name)
+                pending.extend(self.stages[name].depends_on + self.stages[name].awaits)
+        return required
+
+    def run(self, targets: List[StopAt], checkpoints: StageCheckpoints = None,
+            on_stage_done: Callable[[StopAt, Dict[StopAt, dict]], None] = None,
+            should_stop: Callable[[], bool] = None) -> Tuple[Dict[StopAt, dict], Optional[Stage]]:
+        """Run `targets` and their dependencies; returns the outputs and the stage that failed, if any.
+
+        `on_stage_done` is called from the calling thread after each stage. Unexpected errors are
+        re-raised once the stages already running have finished, and so is TaskInterrupted when
+        `should_stop` turns true (or the TaskInterrupted it raises, e.g. TaskCancelled).
+        """
+        checkpoints = checkpoints or StageCheckpoints()
+        order = list(self.stages)
+        remaining = sorted(self.required(targets), key=order.index)
+        outputs: Dict[StopAt, dict] = {}
+        running: Dict[Future, Stage] = {}
+        failed, error = None, None
+
+        def finish(stage: Stage, output: dict):
+            outputs[stage.name] = output
+            remaining.remove(stage.name)
+            if on_stage_done:
+                on_stage_done(stage.name, outputs)
+
+        def start_ready():
+            # resuming a stage from its checkpoint can make the stages after it ready too
+            progressed = True
+            while progressed:
+                progressed = False
+                busy = {stage.name for stage in running.values()}
+                for name in list(remaining):
+                    stage = self.stages[name]
+                    if name in busy or not all(dep in outputs for dep in stage.depends_on):
+                        continue
+                    resumed = checkpoints.resume(name, stage.depends_on + stage.awaits)
+                    if resumed is not None:
+                        finish(stage, resumed)
+                        progressed = True
+                    else:
+                        logger.info(f"running stage {name}")
+                        # stages see the context of the caller, e.g. its cancellation token
+                        running[executor.submit(copy_context().run, stage.run, dict(outputs))] = stage
+                        busy.add(name)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage") as executor:
+            while True:
+                waiting = set(remaining) - {stage.name for stage in running.values()}
+                if waiting and not (failed or error):
+                    try:
+                        stopping = should_stop and should_stop()
+                    except TaskInterrupted as e:
+                        stopping, error = True, e
+                    if stopping:
+                        logger.warning(f"stopping, waiting for {len(running)} running stages")
+                        error = error or TaskInterrupted()
+                    else:
+                        start_ready()
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        output = future.result()
+                    except (TaskInterrupted, TaskStageError) as e:
+                        error = error or e
+                        continue
+                    except Exception as e:
+                        error = error or TaskStageError(stage.name.value, str(e))
+                        continue
+                    if output is None:
+                        failed = failed or stage
+                        continue
+                    checkpoints.save(stage.name, output, stage.artifacts(output), stage.depends_on + stage.awaits)
+                    finish(stage, output)
+
+        if error:
+            raise error
+        return outputs, failed
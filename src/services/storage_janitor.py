@@ -0,0 +1,204 @@
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Sequence, Set, Tuple
+
+from loguru import logger
+
+from src.constants.config import StorageConfig, env
+from src.utils import utils, video_probe
+
+# intermediate files of finished tasks, only needed while rendering
+INTERMEDIATE_PATTERNS = ("combined-*.mp4",)
+
+
+@dataclass
+class Entry:
+    """A file or directory directly under a storage area"""
+    path: Path
+    size: int
+    # newest mtime of the entry's files; cache hits and downloads touch them
+    last_used: float
+
+
+def scan(root: Path) -> List[Entry]:
+    entries = []
+    if not root.is_dir():
+        return entries
+    for path in root.iterdir():
+        try:
+            if path.is_dir():
+                stats = [f.stat() for f in path.rglob("*") if f.is_file()]
+                size = sum(stat.st_size for stat in stats)
+                # not the directory's own mtime, removing intermediates changes it
+                last_used = max((stat.st_mtime for stat in stats), default=path.stat().st_mtime)
+            else:
+                stat = path.stat()
+                size, last_used = stat.st_size, stat.st_mtime
+        except OSError:
+            continue
+        entries.append(Entry(path, size, last_used))
+    return entries
+
+
+def select_evictions(
+        entries: Iterable[Entry], max_bytes: int, ttl_seconds: int, min_age_seconds: int, keep: Set[str], now: float,
+) -> List[Entry]:
+    """Entries unused for longer than `ttl_seconds`, then least recently used ones until the rest fit in `max_bytes`.
+
+    Entries named in `keep` and entries used within `min_age_seconds` are never selected; 0 disables a limit.
+    """
+    entries = sorted(entries, key=lambda e: e.last_used)
+    total = sum(entry.size for entry in entries)
+    evicted = []
+    for entry in entries:
+        if entry.path.name in keep or now - entry.last_used < min_age_seconds:
+            continue
+        expired = ttl_seconds and now - entry.last_used > ttl_seconds
+        if not expired and (not max_bytes or total <= max_bytes):
+            continue
+        evicted.append(entry)
+        total -= entry.size
+    return evicted
+
+
+def remove(path: Path) -> bool:
+    try:
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+        return True
+    except FileNotFoundError:
+        return True
+    except OSError as e:
+        logger.warning(f"failed to remove {path}: {e}")
+        return False
+
+
+class StorageJanitor:
+    """Keeps the downloaded clip caches and the task directories within their byte budgets and ages.
+
+    The clip budget and ttl apply to all of `clip_dirs` together; directories that don't exist are skipped.
+
+    Nothing belonging to a task that is still queued or running is removed: neither its directory nor
+    the cached clips recorded in its result. Evicted tasks stop being reused by identical requests.
+    """
+
+    def __init__(self, config: StorageConfig, clip_dirs: Sequence[str], tasks_dir: str):
+        self.config = config
+        self.clip_dirs = [Path(clip_dir) for clip_dir in clip_dirs]
+        self.tasks_dir = Path(tasks_dir)
+
+    def run(self):
+        try:
+            keep_tasks, keep_clips = self._in_flight()
+        except Exception as e:
+            logger.error(f"storage janitor skipped, failed to load in-flight tasks: {e}")
+            return
+
+        now = time.time()
+        config = self.config
+        purged = self.purge_intermediates(keep_tasks, now)
+
+        clips = select_evictions(
+            [entry for clip_dir in self.clip_dirs for entry in scan(clip_dir)], config.cache_videos_max_bytes, config.cache_videos_ttl_seconds,
+            config.min_age_seconds, keep_clips, now,
+        )
+        clips = [entry for entry in clips if remove(entry.path)]
+        for entry in clips:
+            remove(video_probe.sidecar_path(str(entry.path)))
+
+        tasks = select_evictions(
+            scan(self.tasks_dir), config.tasks_max_bytes, config.tasks_ttl_seconds,
+            config.min_age_seconds, keep_tasks, now,
+        )
+        tasks = [entry for entry in tasks if remove(entry.path)]
+        if tasks:
+            self._forget([entry.path.name for entry in tasks])
+
+        if purged or clips or tasks:
+            freed = sum(entry.size for entry in clips + tasks)
+            logger.info(
+                f"storage janitor removed {purged} intermediate files, {len(clips)} cached clips "
+                f"and {len(tasks)} task directories, {freed / 1024 ** 2:.1f} MiB"
+            )
+
+    def purge_intermediates(self, keep_tasks: Set[str], now: float) -> int:
+        purged = 0
+        if not self.tasks_dir.is_dir():
+            return purged
+        for task_dir in self.tasks_dir.iterdir():
+            if task_dir.name in keep_tasks or not task_dir.is_dir():
+                continue
+            for pattern in INTERMEDIATE_PATTERNS:
+                for path in task_dir.glob(pattern):
+                    try:
+                        if now - path.stat().st_mtime < self.config.intermediate_ttl_seconds:
+                            continue
+                    except OSError:
+                        continue
+                    purged += remove(path)
+        return purged
+
+    @staticmethod
+    def _in_flight() -> Tuple[Set[str], Set[str]]:
+        """Ids of tasks with a pending queue message, and names of the cached clips they use"""
+        # the selection logic above is usable without a configured database
+        from src.db.connection import SessionLocal
+        from src.db.models import Task, TaskQueue
+
+        with SessionLocal() as session:
+            rows = (
+                session.query(Task.id, Task.result, Task.checkpoints)
+                .join(TaskQueue, TaskQueue.task_id == Task.id)
+                .filter(TaskQueue.processed == False)
+                .all()
+            )
+
+        tasks, clips = set(), set()
+        for task_id, result, checkpoints in rows:
+            tasks.add(str(task_id))
+            files = list((result or {}).get("materials") or [])
+            for checkpoint in (checkpoints or {}).values():
+                files += list(checkpoint.get("artifacts") or {})
+            clips.update(os.path.basename(file) for file in files if file)
+        return tasks, clips
+
+    @staticmethod
+    def _forget(task_ids: List[str]):
+        """Stop handing out the outputs of removed task directories to identical requests"""
+        from sqlalchemy import update
+
+        from src.db.connection import SessionLocal
+        from src.db.models import Task
+
+        ids = []
+        for task_id in task_ids:
+            try:
+                ids.append(utils.to_uuid(task_id))
+            except ValueError:
+                continue
+        if not ids:
+            return
+        with SessionLocal() as session:
+            session.execute(
+                update(Task).where(Task.id.in_(ids)).values(fingerprint=None).execution_options(synchronize_session=False)
+            )
+            session.commit()
+
+
+def clip_dirs() -> List[str]:
+    """Where download_videos keeps clips: DIR.clips when it exists, else the cache_videos fallback.
+
+    With DIR.clips set to "task" clips go into the task directories, which are cleaned as tasks.
+    """
+    dirs = [utils.storage_dir("cache_videos")]
+    if env.DIR.clips.as_posix() != "task":
+        dirs.append(env.DIR.clips.as_posix())
+    return dirs
+
+
+storage_janitor = StorageJanitor(env.STORAGE, clip_dirs(), os.path.join(utils.storage_dir(), "tasks"))
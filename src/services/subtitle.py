@@ -6,6 +6,7 @@ from faster_whisper import WhisperModel
 from loguru import logger
 
 from src.constants.config import AiConfig
+from src.services import cancellation
 from src.utils import utils
 
 model = None
@@ -70,6 +71,8 @@ def create(audio_file, subtitle_file: str = ""):
         )
 
     for segment in segments:
+        # transcription runs lazily, one segment per iteration
+        cancellation.check()
         words_idx = 0
         words_len = len(segment.words)
 
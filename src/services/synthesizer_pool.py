@@ -0,0 +1,146 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import azure.cognitiveservices.speech as speechsdk
+from loguru import logger
+
+from src.constants.config import AiConfig
+
+
+class PooledSynthesizer:
+    """A speech synthesizer with an open service connection, bound to one voice and output format"""
+
+    def __init__(self, voice_name: str, output_format: speechsdk.SpeechSynthesisOutputFormat):
+        self.key = (voice_name, output_format)
+        self.on_word_boundary: Optional[Callable] = None
+        self.connected = False
+        self.last_used = time.monotonic()
+
+        speech_config = speechsdk.SpeechConfig(subscription=AiConfig.azure_speech_key, region=AiConfig.azure_speech_region)
+        speech_config.speech_synthesis_voice_name = voice_name
+        speech_config.set_property(property_id=speechsdk.PropertyId.SpeechServiceResponse_RequestWordBoundary, value="true")
+        speech_config.set_speech_synthesis_output_format(output_format)
+
+        # audio_config=None keeps the synthesized audio in memory (result.audio_data)
+        self.synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        self.synthesizer.synthesis_word_boundary.connect(self._on_word_boundary)
+
+        self.connection = speechsdk.Connection.from_speech_synthesizer(self.synthesizer)
+        self.connection.connected.connect(lambda _: self._set_connected(True))
+        self.connection.disconnected.connect(lambda _: self._set_connected(False))
+
+    def _set_connected(self, connected: bool):
+        self.connected = connected
+
+    def _on_word_boundary(self, evt: speechsdk.SpeechSynthesisWordBoundaryEventArgs):
+        if self.on_word_boundary:
+            self.on_word_boundary(evt)
+
+    def open(self):
+        if not self.connected:
+            self.connection.open(False)
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception as e:
+            logger.warning(f"failed to close synthesizer connection: {e}")
+
+
+class SynthesizerPool:
+    """Per-process pool of pre-connected synthesizers keyed by (voice, output format)"""
+
+    def __init__(self, max_idle_per_key: int, idle_timeout: int):
+        self.max_idle_per_key = max_idle_per_key
+        self.idle_timeout = idle_timeout
+        self._idle: Dict[Tuple[str, speechsdk.SpeechSynthesisOutputFormat], List[PooledSynthesizer]] = {}
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self._keeper: Optional[threading.Thread] = None
+
+    def acquire(self, voice_name: str, output_format: speechsdk.SpeechSynthesisOutputFormat) -> PooledSynthesizer:
+        with self._lock:
+            idle = self._idle.get((voice_name, output_format), [])
+            entry = idle.pop() if idle else None
+
+        if entry is None:
+            entry = PooledSynthesizer(voice_name, output_format)
+            entry.open()
+        return entry
+
+    def release(self, entry: PooledSynthesizer, reusable: bool = True):
+        entry.on_word_boundary = None
+        entry.last_used = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(entry.key, [])
+            if reusable and len(idle) < self.max_idle_per_key:
+                idle.append(entry)
+                return
+        entry.close()
+
+    @contextmanager
+    def synthesizer(self, voice_name: str, output_format: speechsdk.SpeechSynthesisOutputFormat, on_word_boundary: Callable):
+        entry = self.acquire(voice_name, output_format)
+        entry.on_word_boundary = on_word_boundary
+        reusable = True
+        try:
+            yield entry
+        except Exception:
+            reusable = False
+            raise
+        finally:
+            self.release(entry, reusable)
+
+    def warm_up(self, voice_names: List[str], output_format: speechsdk.SpeechSynthesisOutputFormat):
+        """Open one connection per voice ahead of the first task and keep it open"""
+        for voice_name in voice_names:
+            self._pinned.add((voice_name, output_format))
+            try:
+                self.release(self.acquire(voice_name, output_format))
+                logger.info(f"synthesizer warmed up: {voice_name}")
+            except Exception as e:
+                logger.warning(f"failed to warm up synthesizer {voice_name}: {e}")
+
+    def close_idle(self):
+        """Close synthesizers unused for `idle_timeout` seconds, reconnecting the warmed-up ones instead"""
+        deadline = time.monotonic() - self.idle_timeout
+        expired = []
+        pinned = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                if key in self._pinned:
+                    pinned.extend(idle)
+                    continue
+                expired.extend(e for e in idle if e.last_used < deadline)
+                idle[:] = [e for e in idle if e.last_used >= deadline]
+
+        for entry in expired:
+            entry.close()
+        for entry in pinned:
+            try:
+                entry.open()
+            except Exception as e:
+                logger.warning(f"failed to reconnect synthesizer {entry.key[0]}: {e}")
+        if expired:
+            logger.info(f"closed {len(expired)} idle synthesizers")
+
+    def start(self, voice_names: List[str], output_format: speechsdk.SpeechSynthesisOutputFormat):
+        if self._keeper or not AiConfig.azure_speech_key:
+            return
+
+        def keep():
+            self.warm_up(voice_names, output_format)
+            while True:
+                time.sleep(max(self.idle_timeout / 2, 1))
+                self.close_idle()
+
+        self._keeper = threading.Thread(target=keep, name="synthesizer-pool", daemon=True)
+        self._keeper.start()
+
+
+synthesizer_pool = SynthesizerPool(
+    max_idle_per_key=AiConfig.azure_tts_pool_size,
+    idle_timeout=AiConfig.azure_tts_pool_idle_seconds,
+)
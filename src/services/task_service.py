@@ -1,17 +1,46 @@
 import math
 import os.path
 import re
+import time
 from os import path
-from typing import Union
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Union
 from loguru import logger
 
 from src.constants.config import env
 from src.constants.enums import TaskStatus, StopAt
 from src.crud.task_crud import TaskCrud
+from src.crud.task_status_writer import TaskStatusWriter
 from src.models.schema import VideoConcatMode, VideoRequest, AudioRequest, SubtitleRequest
 from src.services import llm, material, subtitle, video_service
-from src.services.voice_service import azure_tts_v2, get_audio_duration, create_subtitle, azure_tts_generate_with_srt
-from src.utils import utils
+from src.services.cancellation import CancellationToken, cancellable
+from src.services.checkpoint import StageCheckpoints
+from src.services.stage_graph import Stage, StageGraph
+from src.services.tts_cache import tts_cache, dump_boundaries, load_boundaries
+from src.services.voice_service import azure_tts_v2, get_audio_duration, create_subtitle, azure_tts_generate_with_srt, \
+    AZURE_TTS_OUTPUT_FORMAT, estimate_narration_duration
+from src.utils import metrics, utils
+
+
+# the sequential order of the pipeline; stages may overlap, but status and stop_at follow it
+STAGE_ORDER = [StopAt.SCRIPT, StopAt.AUDIO, StopAt.SUBTITLE, StopAt.TERMS, StopAt.MATERIALS, StopAt.VIDEO]
+
+STAGE_STATUSES = {
+    StopAt.SCRIPT: TaskStatus.SCRIPT_GENERATED,
+    StopAt.AUDIO: TaskStatus.AUDIO_GENERATED,
+    StopAt.SUBTITLE: TaskStatus.SUBTITLE_GENERATED,
+    StopAt.TERMS: TaskStatus.TERMS_GENERATED,
+    StopAt.MATERIALS: TaskStatus.CLIPS_DOWNLOADED,
+    StopAt.VIDEO: TaskStatus.FINAL_VIDEO_GENERATED,
+}
+
+STAGE_RESULT_KEYS = {
+    StopAt.SCRIPT: ["script"],
+    StopAt.AUDIO: ["audio_file", "audio_duration"],
+    StopAt.SUBTITLE: ["subtitle_path"],
+    StopAt.TERMS: ["script", "terms"],
+    StopAt.MATERIALS: ["materials"],
+}
 
 
 class TaskService:
@@ -28,7 +57,6 @@ class TaskService:
             logger.debug(f"video script: \n{video_script}")
 
         if not video_script:
-            TaskCrud.update_task(task_id, TaskStatus.FAILED, failed_reason="failed to generate video script.")
             logger.error("failed to generate video script.")
             return None
 
@@ -53,7 +81,6 @@ class TaskService:
             logger.debug(f"video terms: {utils.to_json(video_terms)}")
 
         if not video_terms:
-            TaskCrud.update_task(task_id, TaskStatus.FAILED, failed_reason="failed to generate video terms.")
             logger.error("failed to generate video terms.")
             return None
 
@@ -70,15 +97,20 @@ class TaskService:
     def _generate_audio(self, task_id, params, video_script):
         logger.info("\n\n## generating audio")
         audio_file = path.join(utils.task_dir(task_id), "audio.mp3")
-        sub_maker = azure_tts_v2(
-            text=video_script,
-            voice_name=params.voice_name,
-            voice_file=audio_file,
-            rate=self.validate_voice_acceleration(params.voice_acceleration),
-        )
+        rate = self.validate_voice_acceleration(params.voice_acceleration)
+        cache_key = tts_cache.make_key(video_script, params.voice_name, rate, AZURE_TTS_OUTPUT_FORMAT.name)
+        sub_maker = tts_cache.get(cache_key, audio_file)
+        if sub_maker is None:
+            sub_maker = azure_tts_v2(
+                text=video_script,
+                voice_name=params.voice_name,
+                voice_file=audio_file,
+                rate=rate,
+            )
+            if sub_maker is not None:
+                tts_cache.put(cache_key, audio_file, sub_maker)
 
         if sub_maker is None:
-            TaskCrud.update_task(task_id, TaskStatus.FAILED, failed_reason="failed to generate audio.")
             logger.error(
                 """failed to generate audio:
     1. check if the language of the voice matches the language of the video script.
@@ -121,14 +153,23 @@ class TaskService:
         return subtitle_path
 
 
-    def _get_video_materials(self, task_id, params, video_terms, audio_duration):
+    @staticmethod
+    def _total_duration(audio_duration: Optional[float], params) -> Optional[float]:
+        return None if audio_duration is None else audio_duration * params.video_count
+
+    def _estimate_audio_duration(self, params, video_script) -> float:
+        rate = self.validate_voice_acceleration(params.voice_acceleration)
+        return estimate_narration_duration(video_script, rate)
+
+    def _get_video_materials(self, task_id, params, video_terms, audio_duration,
+                             final_duration: Callable[[], Optional[float]] = None):
+        """`audio_duration` may be an estimate, then `final_duration` waits for the real one"""
         if params.video_source == "local":
             logger.info("\n\n## preprocess local materials")
             materials = video_service.preprocess_video(
                 materials=params.video_materials, clip_duration=params.video_clip_duration
             )
             if not materials:
-                TaskCrud.update_task(task_id, TaskStatus.FAILED, failed_reason="no valid materials found.")
                 logger.error(
                     "no valid materials found, please check the materials and try again."
                 )
@@ -144,9 +185,9 @@ class TaskService:
                 video_contact_mode=params.video_concat_mode,
                 audio_duration=audio_duration * params.video_count,
                 max_clip_duration=params.video_clip_duration,
+                final_duration=final_duration and (lambda: self._total_duration(final_duration(), params)),
             )
             if not downloaded_videos:
-                TaskCrud.update_task(task_id, TaskStatus.FAILED, failed_reason="failed to download videos.")
                 logger.error(
                     "failed to download videos, maybe the network is not available. if you are in China, please use a VPN."
                 )
@@ -196,111 +237,154 @@ class TaskService:
         return final_video_paths, combined_video_paths
 
 
-    def start(self, task_id: str, params: Union[VideoRequest, AudioRequest, SubtitleRequest], stop_at: StopAt = StopAt.VIDEO):
-        # task_id = TaskCrud.add_task(params, stop_at)
-        logger.info(f"start task: {task_id}, stop_at: {stop_at}")
-
-        # 1. Generate script
-        video_script = self._generate_script(task_id, params)
-        if not video_script or "Error: " in video_script:
-            TaskCrud.update_task(task_id, TaskStatus.FAILED, failed_reason="Generate video script error.")
-            return
-
-        TaskCrud.update_task(task_id, TaskStatus.SCRIPT_GENERATED, {"script": video_script})
-        if stop_at == StopAt.SCRIPT:
-            return {"id": task_id, "script": video_script}
-
-        # 2. Generate audio
-        audio_file, audio_duration, sub_maker = self._generate_audio(
-            task_id, params, video_script
-        )
-
-        if not audio_file:
-            TaskCrud.update_task(task_id, TaskStatus.FAILED, failed_reason="Generate audio error.")
-            return
-
-        TaskCrud.update_task(task_id, TaskStatus.AUDIO_GENERATED, {
-            "audio_file": audio_file,
-            "audio_duration": audio_duration,
-        })
-
-        if stop_at == StopAt.AUDIO:
-            return {"id": task_id, "audio_file": audio_file, "audio_duration": audio_duration}
+    @staticmethod
+    def _load_checkpoints(task_id) -> StageCheckpoints:
+        task = TaskCrud.get_task(task_id)
+        return StageCheckpoints(task.checkpoints if task else None)
+
+    def _stages(self, task_id, params) -> List[Stage]:
+        # also creates the task directory before the stages write to it concurrently
+        boundary_file = path.join(utils.task_dir(task_id), "audio.json")
+        # resolved by the audio stage; clip downloads start on an estimate and wait for it to finish
+        audio_duration = Future()
+
+        def script(outputs):
+            video_script = self._generate_script(task_id, params)
+            if not video_script or "Error: " in video_script:
+                return None
+            return {"script": video_script}
 
-        # 3. Generate subtitle
-        subtitle_path = self._generate_subtitle(
-            task_id, params, video_script, sub_maker, audio_file
-        )
-        TaskCrud.update_task(task_id, TaskStatus.SUBTITLE_GENERATED, {
-            "audio_file": audio_file,
-            "audio_duration": audio_duration,
-            "subtitle_path": subtitle_path
-        })
+        def audio(outputs):
+            try:
+                audio_file, duration, sub_maker = self._generate_audio(
+                    task_id, params, outputs[StopAt.SCRIPT]["script"]
+                )
+                if not audio_file:
+                    return None
+                dump_boundaries(sub_maker, boundary_file)
+                audio_duration.set_result(duration)
+                return {"audio_file": audio_file, "audio_duration": duration}
+            finally:
+                if not audio_duration.done():
+                    audio_duration.set_result(None)
+
+        def subtitle(outputs):
+            subtitle_path = self._generate_subtitle(
+                task_id, params, outputs[StopAt.SCRIPT]["script"],
+                load_boundaries(boundary_file), outputs[StopAt.AUDIO]["audio_file"]
+            )
+            return {"subtitle_path": subtitle_path}
+
+        def terms(outputs):
+            if params.video_source == "local":
+                return {"terms": ""}
+            video_terms = self._generate_terms(task_id, params, outputs[StopAt.SCRIPT]["script"])
+            return {"terms": video_terms} if video_terms else None
+
+        def materials(outputs):
+            if StopAt.AUDIO in outputs:
+                duration = outputs[StopAt.AUDIO]["audio_duration"]
+                downloaded_videos = self._get_video_materials(task_id, params, outputs[StopAt.TERMS]["terms"], duration)
+            else:
+                downloaded_videos = self._get_video_materials(
+                    task_id, params, outputs[StopAt.TERMS]["terms"],
+                    self._estimate_audio_duration(params, outputs[StopAt.SCRIPT]["script"]), audio_duration.result
+                )
+            return {"materials": downloaded_videos} if downloaded_videos else None
 
-        if stop_at == StopAt.SUBTITLE:
-            return {"id": task_id, "subtitle_path": subtitle_path}
+        def video(outputs):
+            final_video_paths, combined_video_paths = self._generate_final_videos(
+                task_id, params, outputs[StopAt.MATERIALS]["materials"],
+                outputs[StopAt.AUDIO]["audio_file"], outputs[StopAt.SUBTITLE]["subtitle_path"]
+            )
+            if not final_video_paths:
+                return None
+            return {"videos": final_video_paths, "combined_videos": combined_video_paths}
+
+        return [
+            Stage(StopAt.SCRIPT, script, failed_reason="Generate video script error."),
+            Stage(StopAt.AUDIO, audio, (StopAt.SCRIPT,), failed_reason="Generate audio error.",
+                  artifacts=lambda output: [output["audio_file"], boundary_file]),
+            Stage(StopAt.SUBTITLE, subtitle, (StopAt.SCRIPT, StopAt.AUDIO), failed_reason="Generate subtitle error.",
+                  artifacts=lambda output: [output["subtitle_path"]]),
+            Stage(StopAt.TERMS, terms, (StopAt.SCRIPT,), failed_reason="Generate video terms error."),
+            Stage(StopAt.MATERIALS, materials, (StopAt.SCRIPT, StopAt.TERMS), awaits=(StopAt.AUDIO,),
+                  failed_reason="Get video materials error.", artifacts=lambda output: output["materials"]),
+            Stage(StopAt.VIDEO, video, (StopAt.MATERIALS, StopAt.AUDIO, StopAt.SUBTITLE),
+                  failed_reason="Generate final videos error.", artifacts=lambda output: output["videos"]),
+        ]
 
-        if type(params.video_concat_mode) is str:
+    @staticmethod
+    def _measured(run: Callable[[Dict[StopAt, dict]], Optional[dict]], stage_metrics: dict):
+        def run_measured(outputs):
+            with metrics.measure(stage_metrics):
+                return run(outputs)
+        return run_measured
+
+    def start(self, task_id: str, params: Union[VideoRequest, AudioRequest, SubtitleRequest], stop_at: StopAt = StopAt.VIDEO,
+              should_stop: Callable[[], bool] = None):
+        """Run the task pipeline up to `stop_at`, overlapping the stages that don't depend on each other.
+
+        Stages finished by an earlier attempt are resumed from their checkpoints. `should_stop` is
+        checked before each stage starts and raises TaskInterrupted; a cancelled task raises TaskCancelled
+        from the next stage boundary or long-running loop. Timings and resource usage of
+        each stage are stored in `task.metrics`.
+        """
+        # task_id = TaskCrud.add_task(params, stop_at)
+        logger.info(f"start task: {task_id}, stop_at: {stop_at}")
+        if type(getattr(params, "video_concat_mode", None)) is str:
             params.video_concat_mode = VideoConcatMode(params.video_concat_mode)
 
-        # 4. Generate terms
-        video_terms = ""
-        if params.video_source != "local":
-            video_terms = self._generate_terms(task_id, params, video_script)
-            if not video_terms:
-                TaskCrud.update_task(task_id, TaskStatus.FAILED, failed_reason="Generate video terms error.")
-                return
-
-        TaskCrud.update_task(task_id, TaskStatus.TERMS_GENERATED, {
-            "audio_file": audio_file,
-            "audio_duration": audio_duration,
-            "subtitle_path": subtitle_path,
-            "terms": video_terms,
-        })
-
-        if stop_at == StopAt.TERMS:
-            return {"id": task_id, "script": video_script, "terms": video_terms}
-
-        # 5. Get video materials
-        downloaded_videos = self._get_video_materials(
-            task_id, params, video_terms, audio_duration
-        )
-        if not downloaded_videos:
-            TaskCrud.update_task(task_id, TaskStatus.FAILED, failed_reason="Get video materials error.")
-            return
-
-        TaskCrud.update_task(task_id, TaskStatus.CLIPS_DOWNLOADED, {
-            "terms": video_terms,
-            "audio_file": audio_file,
-            "audio_duration": audio_duration,
-            "subtitle_path": subtitle_path,
-            "materials": downloaded_videos
-        })
-        if stop_at == StopAt.MATERIALS:
-            return {"id": task_id, "materials": downloaded_videos}
-
-        # 6. Generate final videos
-        final_video_paths, combined_video_paths = self._generate_final_videos(
-            task_id, params, downloaded_videos, audio_file, subtitle_path
-        )
-
-        if not final_video_paths:
-            TaskCrud.update_task(task_id, TaskStatus.FAILED, failed_reason="Generate final videos error.")
-            return
-
-        logger.success(
-            f"task {task_id} finished, generated {len(final_video_paths)} videos."
-        )
+        # stop_at runs every stage up to it in this order, as the sequential pipeline did
+        targets = STAGE_ORDER[:STAGE_ORDER.index(stop_at) + 1]
+        checkpoints = self._load_checkpoints(task_id)
+        stages = self._stages(task_id, params)
+        task_metrics = {"stages": {}}
+        for stage in stages:
+            stage.run = self._measured(stage.run, task_metrics["stages"].setdefault(stage.name.value, {}))
+        graph = StageGraph(stages, env.WORKER.stage_threads)
+
+        def metrics_of(names) -> dict:
+            # skips the stages resumed from checkpoints, which didn't run
+            stage_metrics = {name.value: dict(task_metrics["stages"][name.value]) for name in names}
+            return {**task_metrics, "stages": {name: m for name, m in stage_metrics.items() if m}}
+
+        with TaskStatusWriter(task_id, env.WORKER.status_write_interval_seconds) as status:
+            def on_stage_done(stage: StopAt, outputs: Dict[StopAt, dict]):
+                # report the furthest stage reached in pipeline order, like the sequential pipeline did
+                reached = None
+                for name in targets:
+                    if name not in outputs:
+                        break
+                    reached = name
+                status.update(
+                    STAGE_STATUSES[reached],
+                    outputs[stage],
+                    # stages still running keep adding to theirs
+                    metrics=metrics_of(outputs),
+                    checkpoints=dict(checkpoints.data),
+                )
 
-        result = {
-            "videos": final_video_paths,
-            "combined_videos": combined_video_paths,
-            "terms": video_terms,
-            "audio_file": audio_file,
-            "audio_duration": audio_duration,
-            "subtitle_path": subtitle_path,
-            "materials": downloaded_videos,
-        }
-        TaskCrud.update_task(task_id, TaskStatus.FINAL_VIDEO_GENERATED, result)
-        return result
+            token = CancellationToken(task_id, env.WORKER.cancel_check_seconds)
+
+            def stopping() -> bool:
+                token.check()
+                return bool(should_stop and should_stop())
+
+            started = time.perf_counter()
+            try:
+                with cancellable(token):
+                    outputs, failed = graph.run(targets, checkpoints, on_stage_done, stopping)
+            finally:
+                task_metrics["wall_seconds"] = round(time.perf_counter() - started, 3)
+                task_metrics["process_peak_rss_bytes"] = metrics.process_peak_rss_bytes()
+                status.update(metrics=metrics_of(stage.name for stage in stages))
+            if failed:
+                status.update(TaskStatus.FAILED, failed_reason=failed.failed_reason)
+                return
 
+        result = {key: value for output in outputs.values() for key, value in output.items()}
+        if stop_at == StopAt.VIDEO:
+            logger.success(f"task {task_id} finished, generated {len(result['videos'])} videos.")
+            return result
+        return {"id": task_id, **{key: result[key] for key in STAGE_RESULT_KEYS[stop_at]}}
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Optional
+
+from edge_tts import SubMaker
+from loguru import logger
+
+from src.constants.config import env
+
+
+def dump_boundaries(sub_maker: SubMaker, path: Path):
+    """Write the word boundaries of `sub_maker` to `path` as json"""
+    Path(path).write_text(
+        json.dumps({"subs": sub_maker.subs, "offset": sub_maker.offset}, ensure_ascii=False),
+        encoding="utf-8",
+    )
+
+
+def load_boundaries(path: Path) -> SubMaker:
+    boundaries = json.loads(Path(path).read_text(encoding="utf-8"))
+    sub_maker = SubMaker()
+    sub_maker.subs = boundaries["subs"]
+    sub_maker.offset = [tuple(offset) for offset in boundaries["offset"]]
+    return sub_maker
+
+
+class TtsCache:
+    """Content-addressed cache of synthesized audio and its word boundaries"""
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        return " ".join(text.split())
+
+    @classmethod
+    def make_key(cls, text: str, voice_name: str, rate: str, output_format: str) -> str:
+        raw = "\n".join([cls.normalize_text(text), voice_name.strip(), rate.strip(), output_format])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _audio_path(self, key: str) -> Path:
+        return self.cache_dir.joinpath(f"{key}.audio")
+
+    def _boundary_path(self, key: str) -> Path:
+        return self.cache_dir.joinpath(f"{key}.json")
+
+    def get(self, key: str, audio_file: str) -> Optional[SubMaker]:
+        """Copy the cached audio to `audio_file` and return its word boundaries, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        audio_path = self._audio_path(key)
+        boundary_path = self._boundary_path(key)
+        try:
+            sub_maker = load_boundaries(boundary_path)
+            shutil.copyfile(audio_path, audio_file)
+            os.utime(audio_path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        logger.info(f"tts cache hit: {key}")
+        return sub_maker
+
+    def put(self, key: str, audio_file: str, sub_maker: SubMaker):
+        if not self.enabled:
+            return
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        audio_path = self._audio_path(key)
+        boundary_path = self._boundary_path(key)
+        tmp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            tmp_audio = audio_path.with_name(audio_path.name + tmp_suffix)
+            shutil.copyfile(audio_file, tmp_audio)
+            os.replace(tmp_audio, audio_path)
+
+            tmp_boundary = boundary_path.with_name(boundary_path.name + tmp_suffix)
+            dump_boundaries(sub_maker, tmp_boundary)
+            os.replace(tmp_boundary, boundary_path)
+        except OSError as e:
+            logger.warning(f"failed to write tts cache entry {key}: {e}")
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in `max_bytes`"""
+        with self._lock:
+            entries = []
+            total = 0
+            for audio_path in self.cache_dir.glob("*.audio"):
+                boundary_path = audio_path.with_suffix(".json")
+                try:
+                    stat = audio_path.stat()
+                    size = stat.st_size + (boundary_path.stat().st_size if boundary_path.exists() else 0)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, size, audio_path, boundary_path))
+                total += size
+
+            entries.sort(key=lambda e: e[0])
+            for _, size, audio_path, boundary_path in entries:
+                if total <= self.max_bytes:
+                    break
+                for p in (boundary_path, audio_path):
+                    try:
+                        p.unlink()
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                logger.info(f"tts cache evicted: {audio_path.stem}")
+
+
+tts_cache = TtsCache(env.DIR.tts_cache, env.AI.tts_cache_max_bytes)
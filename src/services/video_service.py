@@ -1,6 +1,7 @@
 import glob
 import os
 import random
+import time
 from pathlib import Path
 from typing import List
 from moviepy import Clip, vfx
@@ -25,7 +26,8 @@ from src.models.schema import (
     VideoRequest,
     VideoTransitionMode,
 )
-from src.utils import utils
+from src.services import cancellation
+from src.utils import metrics, utils, video_probe
 from src.utils.subtitle_utils import add_subtitle, VideoDimension, SubtitleStyle
 
 
@@ -162,15 +164,17 @@ def combine_videos(
     video_clip = concatenate_videoclips(clips)
     video_clip = video_clip.with_fps(30)
     logger.info("writing")
+    encode_started = time.perf_counter()
     # https://github.com/harry0703/MoneyPrinterTurbo/issues/111#issuecomment-2032354030
     video_clip.write_videofile(
         filename=combined_video_path,
         threads=threads,
-        logger=None,
+        logger=cancellation.progress_logger(),
         temp_audiofile_path=output_dir,
         audio_codec="aac",
         fps=30,
     )
+    metrics.record_encode(video_clip.duration * 30, time.perf_counter() - encode_started)
     video_clip.close()
     logger.success("completed")
     return combined_video_path
@@ -251,14 +255,16 @@ def generate_video(
         logger.info(f"Added bgm: {bgm_file}")
 
     video_clip = video_clip.with_audio(audio_clip)
+    encode_started = time.perf_counter()
     video_clip.write_videofile(
         output_file,
         audio_codec="aac",
         temp_audiofile_path=output_dir,
         threads=params.n_threads or 2,
-        logger=None,
+        logger=cancellation.progress_logger(),
         fps=30,
     )
+    metrics.record_encode(video_clip.duration * 30, time.perf_counter() - encode_started)
     video_clip.close()
     del video_clip
     logger.success("completed")
@@ -270,13 +276,17 @@ def preprocess_video(materials: List[MaterialInfo], clip_duration=4):
             continue
 
         ext = utils.parse_extension(material.url)
-        try:
-            clip = VideoFileClip(material.url)
-        except Exception:
-            clip = ImageClip(material.url)
-
-        width = clip.size[0]
-        height = clip.size[1]
+        if ext in const.FILE_TYPE_IMAGES:
+            width, height = ImageClip(material.url).size
+        elif info := video_probe.probe_cached(material.url):
+            width, height = info.width, info.height
+        else:
+            try:
+                clip = VideoFileClip(material.url)
+            except Exception:
+                clip = ImageClip(material.url)
+            width, height = clip.size
+            clip.close()
         if width < 480 or height < 480:
             logger.warning(f"video is too small, width: {width}, height: {height}")
             continue
@@ -304,7 +314,9 @@ def preprocess_video(materials: List[MaterialInfo], clip_duration=4):
 
             # Output the video to a file.
             video_file = f"{material.url}.mp4"
-            final_clip.write_videofile(video_file, fps=30, logger=None)
+            encode_started = time.perf_counter()
+            final_clip.write_videofile(video_file, fps=30, logger=cancellation.progress_logger())
+            metrics.record_encode(final_clip.duration * 30, time.perf_counter() - encode_started)
             final_clip.close()
             del final_clip
             material.url = video_file
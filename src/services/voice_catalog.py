@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from src.constants.config import env
+from src.constants.enums import VoiceType
+from src.models.schema import VoiceOut
+from src.services.voice_service import fetch_azure_voices
+from src.utils.file_utils import write_json
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """One version of the voice list with its indexes, replaced as a whole and never modified"""
+    voices: Tuple[VoiceOut, ...] = ()
+    locales: Tuple[str, ...] = ()
+    by_locale: Dict[str, FrozenSet[int]] = field(default_factory=dict)
+    by_gender: Dict[str, FrozenSet[int]] = field(default_factory=dict)
+    multilingual: FrozenSet[int] = frozenset()
+
+
+class VoiceCatalog:
+    """In-memory voice list indexed by locale, gender and type, persisted to disk and refreshed in the background"""
+
+    def __init__(self, catalog_file: Path, ttl: int, fetch: Callable[[], List[dict]]):
+        self.catalog_file = catalog_file
+        self.ttl = ttl
+        self.fetch = fetch
+        self._snapshot = _Snapshot()
+        self._refresher: Optional[threading.Thread] = None
+
+    def replace(self, data: List[dict]):
+        voices = [VoiceOut(**d) for d in data]
+        by_locale: Dict[str, Set[int]] = {}
+        by_gender: Dict[str, Set[int]] = {}
+        multilingual = set()
+        for i, v in enumerate(voices):
+            by_locale.setdefault(v.Locale.lower(), set()).add(i)
+            by_gender.setdefault(v.Gender.lower(), set()).add(i)
+            if v.ShortName.lower().endswith(VoiceType.MULTILINGUAL_NEURAL.value.lower()):
+                multilingual.add(i)
+
+        # a single reference swap, readers see either the old snapshot or the new one
+        self._snapshot = _Snapshot(
+            voices=tuple(voices),
+            locales=tuple(sorted({v.Locale for v in voices})),
+            by_locale={key: frozenset(value) for key, value in by_locale.items()},
+            by_gender={key: frozenset(value) for key, value in by_gender.items()},
+            multilingual=frozenset(multilingual),
+        )
+
+    @property
+    def voices(self) -> List[VoiceOut]:
+        return list(self._snapshot.voices)
+
+    @property
+    def locales(self) -> List[str]:
+        return list(self._snapshot.locales)
+
+    def load(self) -> bool:
+        try:
+            data = json.loads(self.catalog_file.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"failed to load voice catalog {self.catalog_file}: {e}")
+            return False
+
+        self.replace(data)
+        logger.info(f"loaded {len(self.voices)} voices from {self.catalog_file}")
+        return True
+
+    def refresh(self):
+        data = self.fetch()
+        write_json(self.catalog_file, data)
+        self.replace(data)
+        logger.info(f"refreshed voice catalog, {len(self.voices)} voices")
+
+    def _seconds_until_stale(self) -> float:
+        try:
+            age = time.time() - self.catalog_file.stat().st_mtime
+        except OSError:
+            return 0
+        return max(self.ttl - age, 0)
+
+    def start(self):
+        if self._refresher:
+            return
+
+        self.load()
+
+        def run():
+            while True:
+                delay = self._seconds_until_stale() if self._snapshot.voices else 0
+                time.sleep(delay)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"failed to refresh voice catalog: {e}")
+                    time.sleep(min(self.ttl, 300))
+
+        self._refresher = threading.Thread(target=run, name="voice-catalog", daemon=True)
+        self._refresher.start()
+
+    def search(self, q: str = None, locale: str = None, gender: str = None, multilingual: bool = None) -> List[VoiceOut]:
+        # read once, a refresh meanwhile must not mix the new list with old indexes
+        snapshot = self._snapshot
+        voices = snapshot.voices
+        candidates: Optional[Set[int]] = None
+        if locale:
+            candidates = snapshot.by_locale.get(locale.lower(), frozenset())
+        if gender:
+            matched = snapshot.by_gender.get(gender.lower(), frozenset())
+            candidates = matched if candidates is None else candidates & matched
+        if multilingual is not None:
+            if multilingual:
+                candidates = snapshot.multilingual if candidates is None else candidates & snapshot.multilingual
+            elif candidates is None:
+                candidates = set(range(len(voices))) - snapshot.multilingual
+            else:
+                candidates = candidates - snapshot.multilingual
+
+        indexes = range(len(voices)) if candidates is None else sorted(candidates)
+        return [voices[i] for i in indexes if not q or q in voices[i].ShortName]
+
+
+voice_catalog = VoiceCatalog(
+    catalog_file=env.DIR.voices.joinpath("azure-voices.json"),
+    ttl=env.AI.azure_voices_ttl_seconds,
+    fetch=fetch_azure_voices,
+)
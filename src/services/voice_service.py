@@ -1,4 +1,3 @@
-import asyncio
 import os
 import re
 from datetime import datetime
@@ -6,37 +5,25 @@ from typing import Union, List, Tuple
 from xml.sax.saxutils import unescape
 import requests
 import edge_tts
-from functools import lru_cache
 from edge_tts import SubMaker, submaker
 from edge_tts.submaker import mktimestamp
 from loguru import logger
 from moviepy.video.tools import subtitles
 import azure.cognitiveservices.speech as speechsdk
 
-from src.constants.config import AiConfig, DirConfig
-from src.models.schema import VoiceOut
+from src.constants.config import AiConfig
+from src.services.synthesizer_pool import synthesizer_pool
 from src.utils import utils
-from src.utils.file_utils import write_json
 
+AZURE_TTS_OUTPUT_FORMAT = speechsdk.SpeechSynthesisOutputFormat.Audio48Khz192KBitRateMonoMp3
 
-@lru_cache(maxsize=5)
-def get_azure_voices() -> List[VoiceOut]:
+
+def fetch_azure_voices() -> List[dict]:
     tts_base_url = f"https://{AiConfig.azure_speech_region}.tts.speech.microsoft.com/cognitiveservices"
     tts_headers = {"Ocp-Apim-Subscription-Key": AiConfig.azure_speech_key}
-    response = requests.get(f'{tts_base_url}/voices/list', headers=tts_headers)
-    data = response.json()
-    asyncio.run(write_json(DirConfig.storage.joinpath("voices/azure-voices.json"), data))
-    return [VoiceOut(**d) for d in data]
-
-
-@lru_cache(maxsize=5)
-def get_azure_voice_locales() -> List[str]:
-    voices = get_azure_voices()
-    locales = set()
-    for v in voices:
-        locales.add(v.Locale)
-
-    return sorted(list(locales))
+    response = requests.get(f'{tts_base_url}/voices/list', headers=tts_headers, timeout=(10, 30))
+    response.raise_for_status()
+    return response.json()
 
 
 def _format_duration_to_offset(duration) -> int:
@@ -69,18 +56,6 @@ def azure_tts_v2(text: str, voice_name: str, voice_file: str, rate: str = "+50%"
     try:
         logger.info(f"start, voice name: {voice_name}")
 
-        audio_config = speechsdk.audio.AudioOutputConfig(filename=voice_file, use_default_speaker=True)
-        speech_config = speechsdk.SpeechConfig(subscription=AiConfig.azure_speech_key, region=AiConfig.azure_speech_region)
-        speech_config.speech_synthesis_voice_name = voice_name
-
-        speech_config.set_property(property_id=speechsdk.PropertyId.SpeechServiceResponse_RequestWordBoundary, value="true")
-        speech_config.set_speech_synthesis_output_format(
-            speechsdk.SpeechSynthesisOutputFormat.Audio48Khz192KBitRateMonoMp3
-        )
-
-        speech_synthesizer = speechsdk.SpeechSynthesizer(audio_config=audio_config, speech_config=speech_config)
-        speech_synthesizer.synthesis_word_boundary.connect(speech_synthesizer_word_boundary_cb)
-
         # Wrap text in SSML with prosody rate
         ssml_text = f"""
         <speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis"
@@ -92,8 +67,12 @@ def azure_tts_v2(text: str, voice_name: str, voice_file: str, rate: str = "+50%"
         </speak>
         """
 
-        result = speech_synthesizer.speak_ssml_async(ssml_text).get()
+        with synthesizer_pool.synthesizer(voice_name, AZURE_TTS_OUTPUT_FORMAT, speech_synthesizer_word_boundary_cb) as pooled:
+            result = pooled.synthesizer.speak_ssml_async(ssml_text).get()
+
         if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            with open(voice_file, "wb") as f:
+                f.write(result.audio_data)
             logger.success(f"azure v2 speech synthesis succeeded: {voice_file}")
             return sub_maker
         elif result.reason == speechsdk.ResultReason.Canceled:
@@ -132,9 +111,7 @@ def azure_tts_generate_with_srt(text: str, voice_name: str, audio_file: str, srt
             property_id=speechsdk.PropertyId.SpeechServiceResponse_RequestWordBoundary,
             value="true"
         )
-        speech_config.set_speech_synthesis_output_format(
-            speechsdk.SpeechSynthesisOutputFormat.Audio48Khz192KBitRateMonoMp3
-        )
+        speech_config.set_speech_synthesis_output_format(AZURE_TTS_OUTPUT_FORMAT)
 
         audio_config = speechsdk.audio.AudioOutputConfig(filename=audio_file)
 
@@ -310,3 +287,28 @@ def get_audio_duration(sub_maker: submaker.SubMaker):
         return 0.0
     return sub_maker.offset[-1][1] / 10000000
 
+
+
+# rough speaking speed of the neural voices at +0%; chinese, japanese and korean are counted in characters
+_WORDS_PER_SECOND = 2.5
+_CHARS_PER_SECOND = 4.5
+_CJK_CHARS = re.compile(r"[\u1100-\u11ff\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+_SENTENCE_PAUSE_SECONDS = 0.3
+
+
+def estimate_narration_duration(text: str, rate: str = "+0%") -> float:
+    """
+    Estimate how long a voice takes to read `text` at `rate`, before it is synthesized.
+
+    Counted from the script rather than the voice, since multilingual voices read any language:
+    CJK characters by character, the words between them by word.
+    """
+    chars = len(_CJK_CHARS.findall(text))
+    # punctuation left between CJK characters isn't a word
+    words = sum(1 for word in _CJK_CHARS.sub(" ", text).split() if re.search(r"\w", word))
+    units = chars / _CHARS_PER_SECOND + words / _WORDS_PER_SECOND
+    pauses = len(re.findall(r"[.!?。！？]+", text)) * _SENTENCE_PAUSE_SECONDS
+
+    match = re.fullmatch(r"([+-]?\d+)%", rate.strip())
+    speed = max(1 + int(match.group(1)) / 100, 0.1) if match else 1.0
+    return (units + pauses) / speed
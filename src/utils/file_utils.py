@@ -1,7 +1,75 @@
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Callable
+import hashlib
 import json
+import os
+import time
 
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
 
-async def write_json(path: Path, content: dict):
+
+def write_json(path: Path, content: dict):
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(content, ensure_ascii=False, indent=2))
\ No newline at end of file
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(content, ensure_ascii=False, indent=2))
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def touch(path: str):
+    """Mark a file as recently used, for the least recently used eviction of the storage janitor"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _try_lock(f) -> bool:
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path: str, poll_seconds: float = 0.2, on_wait: Callable[[], None] = None):
+    """Exclusive lock on `path` shared by all processes and threads of this machine.
+
+    Waits until the lock is free, calling `on_wait` between attempts; it may raise to give up.
+    The lock file is left in place, removing it would let a waiting process lock a stale copy.
+    """
+    with open(path, "a+b") as f:
+        while not _try_lock(f):
+            if on_wait:
+                on_wait()
+            time.sleep(poll_seconds)
+        # a lock in use is recent, so the storage janitor leaves it alone
+        touch(path)
+        try:
+            yield
+        finally:
+            _unlock(f)
@@ -0,0 +1,58 @@
+import os
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.constants.config import env
+
+# one session per scheme and host, so connections to a provider are kept alive and reused
+_sessions: Dict[str, requests.Session] = {}
+_sessions_pid = os.getpid()
+_lock = threading.Lock()
+
+
+def _new_session() -> requests.Session:
+    retry = Retry(
+        total=env.CLIP.http_retries,
+        backoff_factor=env.CLIP.http_retry_backoff_seconds,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+        # the last response is returned, callers check its status
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=env.CLIP.http_pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def session_for(url: str) -> requests.Session:
+    """Shared session for the host of `url`; sessions are safe to use from several threads for plain GETs"""
+    global _sessions_pid
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        # connections can't be shared with a forked parent
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = _new_session()
+        return session
+
+
+def proxies(proxy: Optional[str]) -> Optional[dict]:
+    """requests' proxies mapping for a single proxy url such as CLIP_DOWNLOAD_PROXY"""
+    return {"http": proxy, "https": proxy} if proxy else None
+
+
+def get(url: str, proxy: Optional[str] = None, **kwargs) -> requests.Response:
+    """GET through the shared session of the url's host, with retries and backoff on transient errors"""
+    return session_for(url).get(url, proxies=proxies(proxy), **kwargs)
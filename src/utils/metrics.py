@@ -0,0 +1,97 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+# metrics of the stage running in the current thread, see measure()
+_current: ContextVar[Optional[dict]] = ContextVar("stage_metrics", default=None)
+# a stage may add from several threads, e.g. concurrent clip downloads
+_lock = threading.Lock()
+# stages being measured in this process, and whether the resident memory high-water mark
+# was reset when the first of them started, see measure()
+_active = 0
+_peak_reset = False
+# on linux resetting the high-water mark also resets ru_maxrss, so the peaks before resets are kept here
+_earlier_peak = 0
+
+
+def add(name: str, value: float):
+    """Add `value` to a counter of the stage being measured, if any"""
+    metrics = _current.get()
+    if metrics is not None:
+        with _lock:
+            metrics[name] = metrics.get(name, 0) + value
+
+
+def record_encode(frames: float, seconds: float):
+    add("encoded_frames", frames)
+    add("encode_seconds", seconds)
+
+
+def process_peak_rss_bytes() -> Optional[int]:
+    """High-water mark of the resident memory of this process over its whole lifetime"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return max(peak if sys.platform == "darwin" else peak * 1024, _earlier_peak)
+
+
+def reset_peak_rss() -> bool:
+    """Restart the high-water mark read by window_peak_rss_bytes() from the current resident memory, linux only"""
+    global _earlier_peak
+    _earlier_peak = max(_earlier_peak, window_peak_rss_bytes() or 0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def window_peak_rss_bytes() -> Optional[int]:
+    """High-water mark of the resident memory of this process since reset_peak_rss()"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+@contextmanager
+def measure(metrics: dict):
+    """Collect wall time, cpu time of the current thread, peak rss and the counters added meanwhile into `metrics`.
+
+    The high-water mark is process wide, so it is only reset when no other stage is being measured;
+    the peak of stages running side by side covers all of them, since the first one started.
+    Where it can't be reset, peak_rss_bytes is None and only process_peak_rss_bytes is collected.
+    """
+    global _active, _peak_reset
+    with _lock:
+        if not _active:
+            _peak_reset = reset_peak_rss()
+        _active += 1
+    token = _current.set(metrics)
+    wall_started, cpu_started = time.perf_counter(), time.thread_time()
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+        metrics["wall_seconds"] = round(time.perf_counter() - wall_started, 3)
+        metrics["cpu_seconds"] = round(time.thread_time() - cpu_started, 3)
+        with _lock:
+            metrics["peak_rss_bytes"] = window_peak_rss_bytes() if _peak_reset else None
+            _active -= 1
+        metrics["process_peak_rss_bytes"] = process_peak_rss_bytes()
+        if metrics.get("encode_seconds"):
+            metrics["encode_fps"] = round(metrics["encoded_frames"] / metrics["encode_seconds"], 2)
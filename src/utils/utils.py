@@ -3,7 +3,7 @@ import locale
 import os
 import threading
 from typing import Any
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 import urllib3
 from loguru import logger
@@ -63,6 +63,11 @@ def get_uuid(remove_hyphen: bool = False):
     return u
 
 
+def to_uuid(value) -> UUID:
+    """UUID columns need UUID objects on backends without a native uuid type (e.g. sqlite)"""
+    return value if isinstance(value, UUID) else UUID(str(value))
+
+
 def root_dir():
     return os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 
@@ -204,6 +209,15 @@ def md5(text):
     return hashlib.md5(text.encode("utf-8")).hexdigest()
 
 
+def fingerprint(data: dict, exclude: tuple = ()) -> str:
+    """Hash of `data` that doesn't depend on key order, without the top-level keys in `exclude`"""
+    import hashlib
+
+    data = {key: value for key, value in data.items() if key not in exclude}
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
 def get_system_locale():
     try:
         loc = locale.getdefaultlocale()
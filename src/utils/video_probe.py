@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import struct
+import subprocess
+from dataclasses import asdict, dataclass
+from fractions import Fraction
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+from loguru import logger
+
+from src.utils import file_utils
+
+# boxes holding the boxes we read, see ISO/IEC 14496-12
+_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+# don't load absurdly large movie headers into memory
+_MAX_MOOV_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class VideoInfo:
+    duration: float
+    fps: float
+    width: int
+    height: int
+    codec: str = ""
+    # average seconds between keyframes, None when unknown
+    keyframe_interval: Optional[float] = None
+
+    @property
+    def valid(self) -> bool:
+        return self.duration > 0 and self.fps > 0
+
+
+def _boxes(data: bytes, start: int = 0, end: int = None) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, payload start, payload end) of the boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, start)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, start + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header or start + size > end:
+            return
+        yield box_type, start + header, start + size
+        start += size
+
+
+def _read_moov(f: BinaryIO) -> Optional[bytes]:
+    """Payload of the top-level moov box, which may come before or after the media data"""
+    file_size = os.fstat(f.fileno()).st_size
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header:
+            return None
+        if box_type == b"moov":
+            if size > _MAX_MOOV_BYTES:
+                return None
+            payload = f.read(size - header)
+            return payload if len(payload) == size - header else None
+        offset += size
+    return None
+
+
+def _full_box(data: bytes, start: int) -> Tuple[int, int]:
+    """Version and payload start of a full box (version and flags precede its fields)"""
+    return data[start], start + 4
+
+
+def _time_fields(data: bytes, start: int) -> Tuple[int, int]:
+    """Timescale and duration of an mvhd or mdhd box"""
+    version, pos = _full_box(data, start)
+    if version == 1:
+        return struct.unpack_from(">IQ", data, pos + 16)
+    return struct.unpack_from(">II", data, pos + 8)
+
+
+def _parse_track(data: bytes, start: int, end: int) -> Dict:
+    track, stack = {}, [(start, end)]
+    while stack:
+        for box_type, box_start, box_end in _boxes(data, *stack.pop()):
+            if box_type in _CONTAINERS:
+                stack.append((box_start, box_end))
+            elif box_type == b"tkhd":
+                version, pos = _full_box(data, box_start)
+                pos += 32 if version == 1 else 20
+                # reserved, layer, alternate group, volume, reserved and the matrix precede the size
+                width, height = struct.unpack_from(">II", data, pos + 52)
+                track["width"], track["height"] = width >> 16, height >> 16
+            elif box_type == b"mdhd":
+                track["timescale"], track["duration"] = _time_fields(data, box_start)
+            elif box_type == b"hdlr":
+                track["handler"] = data[box_start + 8:box_start + 12]
+            elif box_type == b"stsd":
+                # the codec is the type of the first sample entry
+                track["codec"] = data[box_start + 12:box_start + 16].decode("latin-1").strip()
+            elif box_type == b"stts":
+                count = struct.unpack_from(">I", data, box_start + 4)[0]
+                entries = struct.unpack_from(f">{count * 2}I", data, box_start + 8)
+                track["samples"] = sum(entries[0::2])
+            elif box_type == b"stss":
+                count = struct.unpack_from(">I", data, box_start + 4)[0]
+                track["sync_samples"] = struct.unpack_from(f">{count}I", data, box_start + 8)
+    return track
+
+
+def probe_mp4(path: str) -> Optional[VideoInfo]:
+    """Read the video track's metadata from the header of an MP4 or MOV file, without decoding anything"""
+    try:
+        with open(path, "rb") as f:
+            moov = _read_moov(f)
+        if moov is None:
+            return None
+
+        for box_type, start, end in _boxes(moov):
+            if box_type != b"trak":
+                continue
+            track = _parse_track(moov, start, end)
+            if track.get("handler") != b"vide" or not track.get("timescale"):
+                continue
+
+            duration = track["duration"] / track["timescale"]
+            samples = track.get("samples", 0)
+            fps = samples / duration if duration else 0
+            sync_samples = track.get("sync_samples")
+            keyframe_interval = None
+            if fps:
+                # without a sync sample table every frame is a keyframe
+                keyframes = len(sync_samples) if sync_samples is not None else samples
+                keyframe_interval = round(samples / keyframes / fps, 3) if keyframes else None
+            return VideoInfo(
+                duration=round(duration, 3), fps=round(fps, 3), width=track.get("width", 0),
+                height=track.get("height", 0), codec=track.get("codec", ""), keyframe_interval=keyframe_interval,
+            )
+    except (OSError, struct.error, ValueError) as e:
+        logger.warning(f"failed to parse video header: {path} => {str(e)}")
+    return None
+
+
+def probe_ffprobe(path: str) -> Optional[VideoInfo]:
+    """Metadata from one ffprobe call, for containers the header parser doesn't understand"""
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return None
+    try:
+        output = subprocess.run(
+            [
+                ffprobe, "-v", "error", "-select_streams", "v:0", "-of", "json",
+                "-show_entries", "stream=codec_name,width,height,avg_frame_rate,duration:format=duration",
+                path,
+            ],
+            capture_output=True, check=True, timeout=30,
+        ).stdout
+        result = json.loads(output)
+        stream = result["streams"][0]
+        fps = float(Fraction(stream.get("avg_frame_rate", "0/1")))
+        duration = float(stream.get("duration") or result.get("format", {}).get("duration") or 0)
+        return VideoInfo(
+            duration=round(duration, 3), fps=round(fps, 3), width=int(stream.get("width", 0)),
+            height=int(stream.get("height", 0)), codec=stream.get("codec_name", ""),
+        )
+    except (OSError, subprocess.SubprocessError, ValueError, KeyError, IndexError, ZeroDivisionError) as e:
+        logger.warning(f"ffprobe failed: {path} => {str(e)}")
+    return None
+
+
+def probe(path: str) -> Optional[VideoInfo]:
+    """Duration, fps, size, codec and keyframe interval of a video, None if it can't be read"""
+    info = probe_mp4(path)
+    # a header without usable timing, e.g. of a fragmented mp4, is no verdict on the file
+    if info is None or not info.valid:
+        info = probe_ffprobe(path) or info
+    return info
+
+
+def sidecar_path(video_path: str) -> Path:
+    return Path(f"{video_path}.json")
+
+
+def save_info(video_path: str, info: VideoInfo):
+    """Store `info` next to the video, so later stages don't probe it again"""
+    try:
+        content = {"size": os.path.getsize(video_path), **asdict(info)}
+        file_utils.write_json(sidecar_path(video_path), content)
+    except OSError as e:
+        logger.warning(f"failed to save video info: {video_path} => {str(e)}")
+
+
+def load_info(video_path: str) -> Optional[VideoInfo]:
+    """Info stored next to the video, if it still describes the file"""
+    try:
+        content = json.loads(sidecar_path(video_path).read_text())
+        if content.pop("size") != os.path.getsize(video_path):
+            return None
+        return VideoInfo(**content)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def probe_cached(video_path: str) -> Optional[VideoInfo]:
+    """Stored info of the video, probing it and storing the result on a miss"""
+    info = load_info(video_path)
+    if info is None:
+        info = probe(video_path)
+        if info is not None:
+            save_info(video_path, info)
+    return info
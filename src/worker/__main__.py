@@ -0,0 +1,27 @@
+import asyncio
+import signal
+
+from loguru import logger
+
+from src.db.connection import engine, create_tables
+from src.worker.task_worker import consume_messages
+
+
+async def main():
+    create_tables()
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows: no loop signal handlers
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop_event.set))
+
+    await consume_messages(stop_event)
+    engine.dispose()
+    logger.info("worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+import threading
+
+from loguru import logger
+
+from src.constants.config import env
+from src.constants.consts import TASK_QUEUE_NAME
+from src.services import cancellation
+from src.services.queue_service import QueueService, QueueMessage
+
+
+class LeaseHeartbeat:
+    """Keeps extending the lease on a message while its task makes progress.
+
+    The heartbeat lives in the process that runs the task, so when that process dies
+    the lease runs out and the reaper hands the message to another worker. Progress is
+    reported by the task's cancellation checks (downloaded chunks, transcribed segments,
+    encoded frames, stage boundaries); when none came for `stall_seconds`, e.g. ffmpeg or
+    whisper hung, the heartbeat stops and the lease runs out as well.
+    """
+
+    def __init__(self, message: QueueMessage, interval: float = None, stall_seconds: float = None):
+        self.message = message
+        self.interval = interval or max(env.WORKER.lease_seconds / 3, 1)
+        self.stall_seconds = stall_seconds or env.WORKER.stall_seconds
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            stalled = cancellation.seconds_since_progress()
+            if stalled > self.stall_seconds:
+                logger.error(
+                    f"task of message {self.message.msg_id} made no progress for {stalled:.0f}s, "
+                    f"letting its lease expire"
+                )
+                return
+            if not QueueService.heartbeat(TASK_QUEUE_NAME, self.message.msg_id, self.message.lease_owner):
+                logger.warning(f"lost lease of message {self.message.msg_id}")
+                return
+
+    def __enter__(self):
+        cancellation.report_progress()
+        if self.message.lease_owner:
+            self._thread = threading.Thread(target=self._run, name=f"heartbeat-{self.message.msg_id}", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
@@ -0,0 +1,55 @@
+from collections import Counter
+from typing import Dict, List
+
+from src.constants.enums import QueueLane
+
+
+def parse_lane_weights(items: List[str]) -> Dict[QueueLane, int]:
+    """Parse ["QUICK:3", "RENDER:1"] into {QueueLane.QUICK: 3, QueueLane.RENDER: 1}"""
+    weights = {}
+    for item in items:
+        lane, _, weight = item.partition(":")
+        weights[QueueLane(lane.strip().upper())] = max(int(weight or 1), 1)
+    return weights
+
+
+class LaneScheduler:
+    """Decides which lane a free worker slot claims from.
+
+    Lanes are visited in smooth weighted round-robin order, so with QUICK:3 and RENDER:1
+    three out of four claims prefer the quick lane; an empty lane falls through to the next.
+    Each lane may be capped to a number of slots, keeping capacity for the other lanes.
+    """
+
+    def __init__(self, lanes: List[QueueLane], weights: Dict[QueueLane, int], limits: Dict[QueueLane, int] = None):
+        self.lanes = list(lanes)
+        self.weights = {lane: weights.get(lane, 1) for lane in self.lanes}
+        self.limits = limits or {}
+        self._current = {lane: 0 for lane in self.lanes}
+
+    def order(self, running: Dict[QueueLane, int]) -> List[QueueLane]:
+        """Lanes to try for the next free slot, most deserving first; lanes at their limit are left out"""
+        eligible = [lane for lane in self.lanes if running.get(lane, 0) < self.limits.get(lane, float("inf"))]
+        if not eligible:
+            return []
+
+        total = sum(self.weights[lane] for lane in eligible)
+        for lane in eligible:
+            self._current[lane] += self.weights[lane]
+        ordered = sorted(eligible, key=lambda lane: self._current[lane], reverse=True)
+        self._current[ordered[0]] -= total
+        return ordered
+
+    def plan(self, running: Dict[QueueLane, int], slots: int) -> Counter:
+        """How many of `slots` free slots each lane should fill, as if they were claimed one at a time"""
+        planned = Counter()
+        for _ in range(slots):
+            lanes = self.order(Counter(running) + planned)
+            if not lanes:
+                break
+            planned[lanes[0]] += 1
+        return planned
+
+    def room(self, lane: QueueLane, running: Dict[QueueLane, int]) -> float:
+        """Slots `lane` may still take before hitting its limit"""
+        return max(self.limits.get(lane, float("inf")) - running.get(lane, 0), 0)
@@ -1,31 +1,216 @@
 import asyncio
+import multiprocessing
+import shutil
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import Counter, defaultdict
+from datetime import timedelta
+from typing import Dict, List, Tuple
+
 from loguru import logger
 
+from src.constants.config import env
 from src.constants.consts import TASK_QUEUE_NAME
-from src.constants.enums import StopAt
+from src.constants.enums import QueueLane, StopAt, TaskStatus
 from src.crud.task_crud import TaskCrud
 from src.db.models import Task
+from src.models.exception import TaskCancelled, TaskInterrupted, TaskStageError
 from src.models.schema import AudioRequest, VideoRequest, SubtitleRequest
+from src.services.synthesizer_pool import synthesizer_pool
 from src.services.task_service import TaskService
-from src.services.queue_service import QueueService, QueueMessage
+from src.services.queue_notifier import queue_notifier
+from src.services.queue_service import QueueService, QueueMessage, default_worker_id
+from src.services.storage_janitor import storage_janitor
+from src.services.voice_service import AZURE_TTS_OUTPUT_FORMAT
+from src.utils import utils
+from src.worker.heartbeat import LeaseHeartbeat
+from src.worker.lane_scheduler import LaneScheduler, parse_lane_weights
 
 task_service = TaskService()
 task_crud = TaskCrud()
 
-async def consume_messages():
-    while True:
-        msg: QueueMessage = QueueService.read(TASK_QUEUE_NAME)
-        if msg:
-            logger.info(f"Processing message {msg.msg_id}")
-            try:
-                process_task(msg)
-                QueueService.delete(TASK_QUEUE_NAME, msg.msg_id)
-                logger.info(f"Processed message {msg.msg_id}")
-            except Exception as e:
-                logger.error(f"Failed to process message {msg.msg_id}: {e}")
-                QueueService.retry_message(TASK_QUEUE_NAME, msg.msg_id)
+# set by the dispatcher when draining; tasks stop at the next stage boundary
+_draining = None
+
+
+def _init_worker_process(draining):
+    global _draining
+    _draining = draining
+    # the dispatcher owns shutdown; children finish their current stage instead of dying with it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    synthesizer_pool.start(env.AI.azure_tts_prewarm_voices, AZURE_TTS_OUTPUT_FORMAT)
+
+
+def _acknowledge(completed: List[Tuple[QueueMessage, asyncio.Future]]):
+    """Mark finished messages processed in one statement; failed ones are retried, interrupted ones released.
+
+    Only messages whose lease is still held are acknowledged: a task that stalled past its lease may
+    finish after the reaper gave its message to another worker.
+    """
+    processed = defaultdict(list)
+    for msg, future in completed:
+        error = future.exception()
+        if isinstance(error, TaskCancelled):
+            # usually purged along with its task already, see process_task
+            processed[msg.lease_owner].append(msg.msg_id)
+            logger.info(f"Cancelled message {msg.msg_id}")
+        elif isinstance(error, TaskInterrupted):
+            QueueService.release(TASK_QUEUE_NAME, msg.msg_id, msg.lease_owner)
+        elif error:
+            logger.error(f"Failed to process message {msg.msg_id}: {error}")
+            stage = error.stage if isinstance(error, TaskStageError) else ""
+            QueueService.retry_message(TASK_QUEUE_NAME, msg.msg_id, msg.lease_owner, str(error), stage)
         else:
-            await asyncio.sleep(2)
+            processed[msg.lease_owner].append(msg.msg_id)
+            logger.info(f"Processed message {msg.msg_id}")
+    for worker_id, msg_ids in processed.items():
+        QueueService.delete_batch(TASK_QUEUE_NAME, msg_ids, worker_id)
+
+
+def _build_scheduler(concurrency: int) -> LaneScheduler:
+    lanes = [QueueLane(lane.strip().upper()) for lane in env.WORKER.lanes]
+    limits = {}
+    if QueueLane.QUICK in lanes and QueueLane.RENDER in lanes and concurrency > 1:
+        reserved = min(max(env.WORKER.quick_reserved_slots, 0), concurrency - 1)
+        limits[QueueLane.RENDER] = concurrency - reserved
+    return LaneScheduler(lanes, parse_lane_weights(env.WORKER.lane_weights), limits)
+
+
+def _claim(worker_id: str, scheduler: LaneScheduler, running: Counter, slots: int) -> List[QueueMessage]:
+    """Fill up to `slots` free slots with one claim per lane"""
+    claimed, exhausted = [], set()
+    for lane, count in scheduler.plan(running, slots).items():
+        messages = QueueService.read_batch(TASK_QUEUE_NAME, count, worker_id, [lane])
+        if len(messages) < count:
+            exhausted.add(lane)
+        claimed += messages
+
+    # slots planned for a lane that ran dry go to the other lanes, within their limits
+    running = running + Counter(msg.lane for msg in claimed)
+    for lane in scheduler.lanes:
+        shortfall = slots - len(claimed)
+        if shortfall <= 0:
+            break
+        count = min(shortfall, scheduler.room(lane, running))
+        if lane not in exhausted and count > 0:
+            claimed += QueueService.read_batch(TASK_QUEUE_NAME, count, worker_id, [lane])
+    return claimed
+
+
+async def consume_messages(stop_event: asyncio.Event = None):
+    """Claim messages and dispatch them to a pool of worker processes, at most `concurrency` at a time.
+
+    Free slots are filled with one batched claim per lane and finished messages are acknowledged
+    together, so the queue costs a fraction of a round trip per task.
+
+    Idle consumers sleep until a message is sent (see QueueNotifier), falling back to polling
+    with exponential backoff in case a notification is missed. Once `stop_event` is set, no more
+    messages are claimed, running tasks stop after their current stage and their leases are released.
+    """
+    loop = asyncio.get_running_loop()
+    worker_id = default_worker_id()
+    concurrency = max(env.WORKER.concurrency, 1)
+    stop_event = stop_event or asyncio.Event()
+    scheduler = _build_scheduler(concurrency)
+    in_flight: Dict[asyncio.Future, QueueMessage] = {}
+    mp_context = multiprocessing.get_context("spawn")
+    draining = mp_context.Event()
+
+    def new_executor() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=mp_context,
+            initializer=_init_worker_process,
+            initargs=(draining,),
+            max_tasks_per_child=env.WORKER.max_tasks_per_child or None,
+        )
+
+    executor = new_executor()
+
+    wakeup = asyncio.Event()
+
+    def on_message_sent():
+        loop.call_soon_threadsafe(wakeup.set)
+
+    queue_notifier.subscribe(on_message_sent)
+    queue_notifier.listen(TASK_QUEUE_NAME)
+    backoff = env.WORKER.poll_min_seconds
+    next_reap_at = loop.time()
+    next_archive_at = loop.time()
+    next_janitor_at = loop.time()
+    logger.info(f"worker {worker_id} started, concurrency: {concurrency}, lanes: {scheduler.weights}")
+
+    stopping = asyncio.ensure_future(stop_event.wait())
+    try:
+        while not stop_event.is_set():
+            if loop.time() >= next_reap_at:
+                await asyncio.to_thread(QueueService.reap_expired, TASK_QUEUE_NAME)
+                next_reap_at = loop.time() + env.WORKER.reaper_interval_seconds
+            if loop.time() >= next_archive_at:
+                await asyncio.to_thread(
+                    QueueService.archive_processed,
+                    TASK_QUEUE_NAME,
+                    timedelta(seconds=env.WORKER.archive_after_seconds),
+                    env.WORKER.archive_batch_size,
+                )
+                next_archive_at = loop.time() + env.WORKER.archive_interval_seconds
+            if env.STORAGE.janitor_interval_seconds and loop.time() >= next_janitor_at:
+                await asyncio.to_thread(storage_janitor.run)
+                next_janitor_at = loop.time() + env.STORAGE.janitor_interval_seconds
+
+            waiters = {*in_flight, stopping}
+            free = concurrency - len(in_flight)
+            if free > 0:
+                wakeup.clear()
+                running = Counter(msg.lane for msg in in_flight.values())
+                messages = await asyncio.to_thread(_claim, worker_id, scheduler, running, free)
+                for index, msg in enumerate(messages):
+                    logger.info(f"Processing message {msg.msg_id}, lane: {msg.lane}")
+                    try:
+                        in_flight[loop.run_in_executor(executor, process_task, msg)] = msg
+                    except BrokenProcessPool:
+                        # a child died (e.g. killed for memory); its tasks fail and are retried,
+                        # the messages not dispatched yet go back to the queue untouched
+                        logger.error("worker process pool broken, restarting it")
+                        for undispatched in messages[index:]:
+                            await asyncio.to_thread(
+                                QueueService.release, TASK_QUEUE_NAME, undispatched.msg_id, undispatched.lease_owner,
+                            )
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        executor = new_executor()
+                        break
+                if messages:
+                    backoff = env.WORKER.poll_min_seconds
+                    continue
+                waiters.add(asyncio.ensure_future(wakeup.wait()))
+
+            timeout = max(min(backoff, next_reap_at - loop.time()), 0)
+            done, pending = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for future in pending - {*in_flight, stopping}:
+                future.cancel()
+
+            if done:
+                backoff = env.WORKER.poll_min_seconds
+            else:
+                backoff = min(backoff * 2, env.WORKER.poll_max_seconds)
+
+            completed = [(in_flight.pop(future), future) for future in done & set(in_flight)]
+            if completed:
+                await asyncio.to_thread(_acknowledge, completed)
+
+        logger.info(f"worker {worker_id} draining, {len(in_flight)} tasks in flight")
+        draining.set()
+        if in_flight:
+            await asyncio.wait(in_flight)
+            await asyncio.to_thread(_acknowledge, [(msg, future) for future, msg in in_flight.items()])
+        in_flight.clear()
+        logger.info(f"worker {worker_id} drained")
+    finally:
+        stopping.cancel()
+        queue_notifier.unsubscribe(on_message_sent)
+        executor.shutdown(wait=not in_flight, cancel_futures=True)
 
 
 def process_task(message: QueueMessage):
@@ -35,6 +220,14 @@ def process_task(message: QueueMessage):
         return
 
     task: Task = task_crud.get_task(task_id)
+    if not task:
+        logger.info(f"task {task_id} was deleted before it started")
+        return
+    if task.status == TaskStatus.CANCELLED:
+        # e.g. cancelled while leased by a worker that died
+        logger.info(f"task {task_id} was cancelled before it started")
+        task_crud.delete_task(task_id)
+        return
     stop_at = StopAt(task.stop_at)
     request = VideoRequest
     if stop_at == StopAt.AUDIO:
@@ -43,5 +236,11 @@ def process_task(message: QueueMessage):
         request = SubtitleRequest
     params = request(**task.params)
 
-    task_service.start(task.id, params, stop_at)
-
+    with LeaseHeartbeat(message):
+        try:
+            task_service.start(task.id, params, stop_at, should_stop=_draining.is_set if _draining else None)
+        except TaskCancelled:
+            # stages may have written into the directory after it was removed
+            shutil.rmtree(utils.task_dir(task.id), ignore_errors=True)
+            task_crud.delete_task(task_id)
+            raise
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+import pytest
+
+# the database tests run against, never one configured in the environment or .env
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='videowind-tests-'), 'test.db')}"
+
+
+@pytest.fixture
+def db():
+    """Empty tables for each test"""
+    import src.db.models  # noqa: F401, registers the tables
+    from src.db.connection import Base, create_tables, engine
+
+    Base.metadata.drop_all(engine)
+    create_tables()
+    yield engine
+    Base.metadata.drop_all(engine)
@@ -0,0 +1,70 @@
+from src.constants.consts import TASK_QUEUE_NAME
+from src.constants.enums import QueueLane, StopAt, TaskStatus
+from src.crud.task_crud import TaskCrud
+from src.db.connection import SessionLocal
+from src.db.models import Task, TaskQueue
+from src.models.schema import AudioRequest
+from src.services.cancellation import CancellationToken
+from src.services.queue_service import QueueService
+from src.utils.utils import to_uuid
+
+
+def _queued(task_id) -> TaskQueue:
+    with SessionLocal() as session:
+        return session.query(TaskQueue).filter(TaskQueue.task_id == to_uuid(task_id)).first()
+
+
+def test_new_task_is_queued_with_it(db):
+    task_id, created = TaskCrud.add_task(AudioRequest(), StopAt.AUDIO)
+    assert created
+    assert _queued(task_id).lane == QueueLane.QUICK.value
+
+
+def test_identical_request_reuses_task(db):
+    task_id, _ = TaskCrud.add_task(AudioRequest(), StopAt.AUDIO)
+    # params that don't change the output don't matter
+    assert TaskCrud.add_task(AudioRequest(reuse_existing=True), StopAt.AUDIO) == (task_id, False)
+
+    other_id, created = TaskCrud.add_task(AudioRequest(voice_volume=0.5), StopAt.AUDIO)
+    assert created and other_id != task_id
+    assert TaskCrud.add_task(AudioRequest(), StopAt.SUBTITLE)[1]
+
+
+def test_reuse_can_be_turned_off(db):
+    task_id, _ = TaskCrud.add_task(AudioRequest(), StopAt.AUDIO)
+    other_id, created = TaskCrud.add_task(AudioRequest(reuse_existing=False), StopAt.AUDIO)
+    assert created and other_id != task_id
+    assert _queued(other_id)
+
+
+def test_failed_and_unqueued_tasks_are_not_reused(db):
+    task_id, _ = TaskCrud.add_task(AudioRequest(), StopAt.AUDIO)
+    TaskCrud.update_task(task_id, TaskStatus.FAILED)
+    assert TaskCrud.add_task(AudioRequest(), StopAt.AUDIO)[0] != task_id
+
+    with SessionLocal() as session:
+        session.query(TaskQueue).delete()
+        session.commit()
+    # INIT without a queue message would never run
+    assert TaskCrud.add_task(AudioRequest(), StopAt.AUDIO)[1]
+    with SessionLocal() as session:
+        assert session.query(Task).count() == 3
+
+
+def test_cancelling_a_waiting_task_deletes_it(db):
+    task_id, _ = TaskCrud.add_task(AudioRequest(), StopAt.AUDIO)
+    assert TaskCrud.cancel_task(task_id)
+    assert TaskCrud.get_task(task_id) is None
+    assert _queued(task_id) is None
+
+
+def test_cancelling_a_running_task_flags_it(db):
+    task_id, _ = TaskCrud.add_task(AudioRequest(), StopAt.AUDIO)
+    assert QueueService.read(TASK_QUEUE_NAME, worker_id="w1")
+    TaskCrud.cancel_task(task_id)
+
+    # the worker sees the flag, stops and purges the task
+    assert TaskCrud.get_task(task_id).status == TaskStatus.CANCELLED.value
+    assert CancellationToken(task_id).is_cancelled()
+    TaskCrud.delete_task(task_id)
+    assert _queued(task_id) is None
@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import event
+
+from src.constants.enums import StopAt, TaskStatus
+from src.crud.task_status_writer import TaskStatusWriter
+from src.db.connection import SessionLocal
+from src.db.models import Task
+from src.utils.utils import to_uuid
+
+
+def _task(**values) -> str:
+    with SessionLocal() as session:
+        task = Task(stop_at=StopAt.VIDEO.value, params={}, **values)
+        session.add(task)
+        session.commit()
+        return str(task.id)
+
+
+def _get(task_id) -> Task:
+    with SessionLocal() as session:
+        return session.get(Task, to_uuid(task_id))
+
+
+@pytest.fixture
+def updates(db):
+    """UPDATE statements run against the tasks table"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if statement.startswith("UPDATE tasks"):
+            statements.append(statement)
+
+    event.listen(db, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(db, "before_cursor_execute", before_cursor_execute)
+
+
+def test_result_fields_are_merged(db):
+    task_id = _task(result={"script": "hello", "video_subject": "greeting"})
+    with TaskStatusWriter(task_id, min_interval=0) as writer:
+        writer.update(result={"terms": ["a", "b"]})
+        writer.update(TaskStatus.AUDIO_GENERATED, result={"audio_file": "audio.mp3", "script": "hello, world"})
+
+    task = _get(task_id)
+    assert task.status == TaskStatus.AUDIO_GENERATED.value
+    assert task.result == {
+        "script": "hello, world", "video_subject": "greeting", "terms": ["a", "b"], "audio_file": "audio.mp3",
+    }
+
+
+def test_updates_within_interval_are_coalesced(updates):
+    task_id = _task()
+    with TaskStatusWriter(task_id, min_interval=60) as writer:
+        writer.update(TaskStatus.SCRIPT_GENERATED, result={"script": "hello"})
+        writer.update(TaskStatus.TERMS_GENERATED, result={"terms": ["a"]})
+        writer.update(result={"audio_file": "audio.mp3"}, metrics={"script": {"wall_seconds": 1}})
+        assert len(updates) == 1
+        assert _get(task_id).result == {"script": "hello"}
+
+    # closing writes the pending changes as one
+    assert len(updates) == 2
+    task = _get(task_id)
+    assert task.status == TaskStatus.TERMS_GENERATED.value
+    assert task.result == {"script": "hello", "terms": ["a"], "audio_file": "audio.mp3"}
+    assert task.metrics == {"script": {"wall_seconds": 1}}
+
+
+def test_failure_is_written_immediately(db):
+    task_id = _task()
+    with TaskStatusWriter(task_id, min_interval=60) as writer:
+        writer.update(TaskStatus.SCRIPT_GENERATED)
+        writer.update(TaskStatus.FAILED, failed_reason="boom")
+        task = _get(task_id)
+        assert (task.status, task.failed_reason) == (TaskStatus.FAILED.value, "boom")
+
+
+def test_cancelled_task_is_not_overwritten(db):
+    task_id = _task(status=TaskStatus.CANCELLED.value)
+    with TaskStatusWriter(task_id, min_interval=0) as writer:
+        writer.update(TaskStatus.AUDIO_GENERATED, result={"audio_file": "audio.mp3"})
+
+    task = _get(task_id)
+    assert task.status == TaskStatus.CANCELLED.value and not task.result
@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine, inspect
+
+from src.db.connection import create_tables
+
+# tasks and task_queue as created before lanes, leases, backoff, metrics and fingerprints
+BASELINE_SCHEMA = [
+    "CREATE TABLE tasks (id CHAR(32) PRIMARY KEY, created_at DATETIME, updated_at DATETIME, status VARCHAR(30), "
+    "stop_at VARCHAR(30) NOT NULL, params JSON, result JSON, failed_reason TEXT)",
+    "CREATE TABLE task_queue (id CHAR(32) PRIMARY KEY, created_at DATETIME, updated_at DATETIME, "
+    "task_id CHAR(32) NOT NULL UNIQUE REFERENCES tasks(id), message JSON NOT NULL, processed BOOLEAN NOT NULL, "
+    "processing_started_at DATETIME, processed_at DATETIME, retry_count INTEGER NOT NULL, max_retries INTEGER NOT NULL)",
+    "INSERT INTO tasks VALUES ('01a15409abb6735697b95aeea301acf1', NULL, NULL, 'INIT', 'AUDIO', '{}', '{}', '')",
+    "INSERT INTO task_queue VALUES ('01a15409abb6735697b95aeea301acf2', NULL, NULL, "
+    "'01a15409abb6735697b95aeea301acf1', '{}', 0, NULL, NULL, 0, 3)",
+]
+
+
+def test_existing_tables_are_upgraded(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.exec_driver_sql(statement)
+
+    create_tables(engine)
+    # running it again changes nothing
+    create_tables(engine)
+
+    inspector = inspect(engine)
+    assert {"lane", "lease_owner", "lease_expires_at", "visible_after"} <= {
+        column["name"] for column in inspector.get_columns("task_queue")
+    }
+    assert {"ix_task_queue_claim", "ix_task_queue_lease"} <= {index["name"] for index in inspector.get_indexes("task_queue")}
+    assert "ix_tasks_fingerprint" in {index["name"] for index in inspector.get_indexes("tasks")}
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT lane FROM task_queue").scalar() == "RENDER"
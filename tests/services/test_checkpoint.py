@@ -0,0 +1,47 @@
+from src.constants.enums import StopAt
+from src.services.checkpoint import StageCheckpoints
+
+SCRIPT, AUDIO, SUBTITLE, TERMS = StopAt.SCRIPT, StopAt.AUDIO, StopAt.SUBTITLE, StopAt.TERMS
+
+
+def test_resume_intact_stages(tmp_path):
+    audio_file = tmp_path.joinpath("audio.mp3")
+    audio_file.write_bytes(b"audio")
+
+    first = StageCheckpoints()
+    first.save(SCRIPT, {"script": "hello"})
+    data = first.save(AUDIO, {"audio_file": str(audio_file)}, [str(audio_file)], [SCRIPT])
+
+    retry = StageCheckpoints(data)
+    assert retry.resume(SCRIPT) == {"script": "hello"}
+    assert retry.resume(AUDIO, [SCRIPT]) == {"audio_file": str(audio_file)}
+    assert retry.resume(SUBTITLE, [AUDIO]) is None
+
+
+def test_changed_artifact_invalidates_dependents(tmp_path):
+    audio_file = tmp_path.joinpath("audio.mp3")
+    audio_file.write_bytes(b"audio")
+
+    first = StageCheckpoints()
+    first.save(SCRIPT, {"script": "hello"})
+    first.save(AUDIO, {"audio_file": str(audio_file)}, [str(audio_file)], [SCRIPT])
+    first.save(SUBTITLE, {"subtitle_path": ""}, [], [AUDIO])
+    data = first.save(TERMS, {"terms": ["sea"]}, [], [SCRIPT])
+    audio_file.write_bytes(b"truncated")
+
+    retry = StageCheckpoints(data)
+    assert retry.resume(SCRIPT) == {"script": "hello"}
+    assert retry.resume(AUDIO, [SCRIPT]) is None
+    assert retry.resume(TERMS, [SCRIPT]) == {"terms": ["sea"]}
+    assert sorted(retry.data) == [SCRIPT.value, TERMS.value]
+
+
+def test_rerun_drops_stale_dependents():
+    first = StageCheckpoints()
+    first.save(SCRIPT, {"script": "hello"})
+    first.save(AUDIO, {"audio_file": ""}, [], [SCRIPT])
+    data = first.save(SUBTITLE, {"subtitle_path": ""}, [], [AUDIO])
+
+    retry = StageCheckpoints(data)
+    retry.save(AUDIO, {"audio_file": "new"}, [], [SCRIPT])
+    assert SUBTITLE.value not in retry.data
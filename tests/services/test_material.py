@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.models.schema import MaterialInfo, VideoConcatMode
+from src.services import material
+from src.services.voice_service import estimate_narration_duration
+
+VIDEO = "tests/files/videos/1280x720.mp4"
+
+
+def _fake_provider(monkeypatch, count=10):
+    items = []
+    for i in range(count):
+        item = MaterialInfo()
+        item.url = f"https://clips.example/{i}.mp4"
+        item.duration = 5
+        items.append(item)
+    saved = []
+    monkeypatch.setattr(material, "search_videos_pexels", lambda **kwargs: items)
+    monkeypatch.setattr(material, "save_video", lambda video_url, save_dir: saved.append(video_url) or video_url)
+    return saved
+
+
+def _download(audio_duration, final_duration=None, concurrency=1):
+    return material.download_videos(
+        "task", ["sea"], video_contact_mode=VideoConcatMode.sequential,
+        audio_duration=audio_duration, max_clip_duration=5, final_duration=final_duration, concurrency=concurrency,
+    )
+
+
+def test_download_covers_duration(monkeypatch):
+    _fake_provider(monkeypatch)
+    assert len(_download(12)) == 3
+
+
+def test_underestimate_is_topped_up(monkeypatch):
+    saved = _fake_provider(monkeypatch)
+    assert len(_download(7, lambda: 22)) == 5
+    assert len(saved) == 5
+
+
+def test_overestimate_is_trimmed(monkeypatch):
+    saved = _fake_provider(monkeypatch)
+    assert len(_download(22, lambda: 7)) == 2
+    assert len(saved) == 5
+
+
+def test_no_duration_gives_up(monkeypatch):
+    _fake_provider(monkeypatch)
+    assert _download(7, lambda: None) == []
+
+
+def test_concurrent_downloads_keep_order(monkeypatch):
+    _fake_provider(monkeypatch)
+
+    def save_video(video_url, save_dir):
+        # later clips finish first
+        time.sleep(0.05 - int(video_url.split("/")[-1][:-4]) * 0.005)
+        return video_url
+
+    monkeypatch.setattr(material, "save_video", save_video)
+    assert _download(22, concurrency=4) == [f"https://clips.example/{i}.mp4" for i in range(5)]
+    assert len(_download(7, lambda: 22, concurrency=4)) == 5
+
+
+def test_estimate_narration_duration():
+    words = " ".join(["word"] * 50)
+    assert estimate_narration_duration(words) == 20
+    assert estimate_narration_duration(words, "+100%") == 10
+    assert estimate_narration_duration("你好世界你好世界你") == 2
+    # counted from the text, whatever voice reads it
+    assert estimate_narration_duration("你好世界，你好世界你。") == 2.3
+    assert estimate_narration_duration("你好世界你好世界你 word word word word word") == 4
+
+
+class _ClipServer(ThreadingHTTPServer):
+    """Serves `body` with Range support; the first `cut` responses stop after half of what they announce"""
+
+    def __init__(self, body: bytes, cut: int = 0):
+        super().__init__(("127.0.0.1", 0), _ClipHandler)
+        self.body = body
+        self.cut = cut
+        self.ranges = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/clip.mp4"
+
+
+class _ClipHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body, start = self.server.body, 0
+        range_header = self.headers.get("Range")
+        self.server.ranges.append(range_header)
+        if range_header:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        chunk = body[start:]
+        if self.server.cut:
+            self.server.cut -= 1
+            chunk = chunk[:len(chunk) // 2]
+        self.wfile.write(chunk)
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def _serve(body, cut=0):
+    server = _ClipServer(body, cut)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_interrupted_download_is_resumed(tmp_path):
+    body = os.urandom(300_000)
+    path = tmp_path / "clip.mp4.part"
+    with _serve(body, cut=2) as server:
+        assert material._download_file(server.url, str(path), attempts=3, chunk_size=4096) == len(body)
+    assert path.read_bytes() == body
+    # the second and third requests continue where the previous ones broke off
+    assert server.ranges[0] is None and all(int(r[6:-1]) > 0 for r in server.ranges[1:])
+    assert len(server.ranges) == 3
+
+
+def test_save_video_publishes_verified_file(tmp_path):
+    with open(VIDEO, "rb") as f:
+        body = f.read()
+    with _serve(body, cut=1) as server:
+        video_path = material.save_video(server.url, str(tmp_path))
+    assert open(video_path, "rb").read() == body
+    assert not os.path.exists(f"{video_path}.part")
+
+
+def test_save_video_drops_invalid_file(tmp_path):
+    with _serve(b"not a video") as server:
+        assert material.save_video(server.url, str(tmp_path)) == ""
+    assert not [name for name in os.listdir(tmp_path) if not name.endswith(".lock")]
+
+
+def test_same_clip_is_downloaded_once(tmp_path):
+    with open(VIDEO, "rb") as f:
+        body = f.read()
+    with _serve(body) as server, ThreadPoolExecutor(max_workers=4) as executor:
+        paths = list(executor.map(lambda _: material.save_video(server.url, str(tmp_path)), range(4)))
+    assert len(set(paths)) == 1 and paths[0]
+    assert len(server.ranges) == 1
+
+
+def test_save_video_falls_back_to_decoder(monkeypatch, tmp_path):
+    decoded = material.video_probe.VideoInfo(duration=10, fps=25, width=720, height=1280)
+    monkeypatch.setattr(material.video_probe, "probe", lambda path: material.video_probe.VideoInfo(0, 0, 720, 1280))
+    monkeypatch.setattr(material, "_probe_with_moviepy", lambda path: decoded)
+    with open(VIDEO, "rb") as f:
+        body = f.read()
+    with _serve(body) as server:
+        video_path = material.save_video(server.url, str(tmp_path))
+    assert video_path and material.video_probe.load_info(video_path) == decoded
@@ -0,0 +1,167 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from src.constants.consts import TASK_QUEUE_NAME
+from src.constants.enums import QueueLane, StopAt, TaskStatus
+from src.crud.task_crud import TaskCrud
+from src.db.connection import SessionLocal
+from src.db.models import Task, TaskDeadLetter, TaskQueue, TaskQueueArchive
+from src.services.queue_service import QueueService
+from src.utils.date_utils import get_now
+from src.utils.utils import to_uuid
+
+
+def _send(lane=QueueLane.RENDER) -> str:
+    with SessionLocal() as session:
+        task = Task(stop_at=StopAt.VIDEO.value, params={})
+        session.add(task)
+        session.commit()
+        task_id = str(task.id)
+    QueueService.send(TASK_QUEUE_NAME, {"task_id": task_id}, lane)
+    return task_id
+
+
+def _update(msg_id, **values):
+    with SessionLocal() as session:
+        session.query(TaskQueue).filter(TaskQueue.id == to_uuid(msg_id)).update(values)
+        session.commit()
+
+
+def _item(msg_id) -> TaskQueue:
+    with SessionLocal() as session:
+        return session.get(TaskQueue, to_uuid(msg_id))
+
+
+def _past():
+    return get_now() - timedelta(minutes=1)
+
+
+def test_oldest_messages_are_claimed_once(db):
+    task_ids = [_send() for _ in range(3)]
+
+    first = QueueService.read_batch(TASK_QUEUE_NAME, 2, "w1")
+    assert [msg.message["task_id"] for msg in first] == task_ids[:2]
+    assert all(msg.lease_owner == "w1" for msg in first)
+    assert [msg.message["task_id"] for msg in QueueService.read_batch(TASK_QUEUE_NAME, 5, "w2")] == task_ids[2:]
+    assert QueueService.read(TASK_QUEUE_NAME, "w3") is None
+
+
+def test_concurrent_claims_never_overlap(db):
+    for _ in range(6):
+        _send()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        claims = list(executor.map(lambda i: QueueService.read_batch(TASK_QUEUE_NAME, 1, f"w{i}"), range(8)))
+    claimed = [msg.msg_id for messages in claims for msg in messages]
+    # claims losing the write lock come back empty, the rest is still there
+    claimed += [msg.msg_id for msg in QueueService.read_batch(TASK_QUEUE_NAME, 10, "late")]
+    assert len(claimed) == len(set(claimed)) == 6
+
+
+def test_claims_by_lane(db):
+    quick = _send(QueueLane.QUICK)
+    _send(QueueLane.RENDER)
+
+    [msg] = QueueService.read_batch(TASK_QUEUE_NAME, 5, "w1", [QueueLane.QUICK])
+    assert msg.message["task_id"] == quick and msg.lane == QueueLane.QUICK
+
+
+def test_expired_lease_is_reaped_and_heartbeat_lost(db):
+    _send()
+    [msg] = QueueService.read_batch(TASK_QUEUE_NAME, 1, "w1")
+    assert QueueService.heartbeat(TASK_QUEUE_NAME, msg.msg_id, "w1")
+    assert not QueueService.heartbeat(TASK_QUEUE_NAME, msg.msg_id, "w2")
+    assert QueueService.reap_expired(TASK_QUEUE_NAME) == 0
+
+    _update(msg.msg_id, lease_expires_at=_past())
+    assert QueueService.reap_expired(TASK_QUEUE_NAME) == 1
+    assert not QueueService.heartbeat(TASK_QUEUE_NAME, msg.msg_id, "w1")
+    item = _item(msg.msg_id)
+    assert item.retry_count == 1 and item.lease_owner is None and item.visible_after is not None
+
+
+def test_failed_message_is_held_back(db):
+    _send()
+    [msg] = QueueService.read_batch(TASK_QUEUE_NAME, 1, "w1")
+    assert QueueService.retry_message(TASK_QUEUE_NAME, msg.msg_id, "w1", "boom", "VIDEO")
+
+    assert QueueService.read_batch(TASK_QUEUE_NAME, 1, "w1") == []
+    _update(msg.msg_id, visible_after=_past())
+    [again] = QueueService.read_batch(TASK_QUEUE_NAME, 1, "w1")
+    assert again.msg_id == msg.msg_id and again.retry_count == 1
+
+
+def test_released_message_keeps_its_attempts(db):
+    _send()
+    [msg] = QueueService.read_batch(TASK_QUEUE_NAME, 1, "w1")
+    assert QueueService.release(TASK_QUEUE_NAME, msg.msg_id, "w1")
+    [again] = QueueService.read_batch(TASK_QUEUE_NAME, 1, "w2")
+    assert again.msg_id == msg.msg_id and again.retry_count == 0
+
+
+def test_message_out_of_retries_is_dead_lettered(db):
+    task_id = _send()
+    for attempt in range(3):
+        [msg] = QueueService.read_batch(TASK_QUEUE_NAME, 1, "w1")
+        QueueService.retry_message(TASK_QUEUE_NAME, msg.msg_id, "w1", f"boom {attempt}", "VIDEO")
+        _update(msg.msg_id, visible_after=None)
+
+    assert QueueService.read_batch(TASK_QUEUE_NAME, 1, "w1") == []
+    assert _item(msg.msg_id).processed
+    with SessionLocal() as session:
+        [dead] = session.query(TaskDeadLetter).all()
+        task = session.get(Task, to_uuid(task_id))
+    assert (dead.retry_count, dead.stage, dead.last_error) == (3, "VIDEO", "boom 2")
+    assert (task.status, task.failed_reason) == (TaskStatus.FAILED.value, "boom 2")
+
+
+def test_old_processed_messages_are_archived(db):
+    _send()
+    _send()
+    old, recent = QueueService.read_batch(TASK_QUEUE_NAME, 2, "w1")
+    assert QueueService.delete_batch(TASK_QUEUE_NAME, [old.msg_id, recent.msg_id], "w1") == 2
+    _update(old.msg_id, processed_at=get_now() - timedelta(days=2))
+
+    assert QueueService.archive_processed(TASK_QUEUE_NAME, timedelta(days=1), batch_size=1) == 1
+    with SessionLocal() as session:
+        assert [str(item.id) for item in session.query(TaskQueueArchive).all()] == [old.msg_id]
+        assert [str(item.id) for item in session.query(TaskQueue).all()] == [recent.msg_id]
+
+
+def test_stale_worker_cannot_acknowledge_reclaimed_message(db):
+    _send()
+    [stale] = QueueService.read_batch(TASK_QUEUE_NAME, 1, "w1")
+    _update(stale.msg_id, lease_expires_at=_past())
+    assert QueueService.reap_expired(TASK_QUEUE_NAME) == 1
+    _update(stale.msg_id, visible_after=None)
+    [current] = QueueService.read_batch(TASK_QUEUE_NAME, 1, "w2")
+
+    # the task that stalled past its lease finishes while w2 runs the message again
+    assert QueueService.delete_batch(TASK_QUEUE_NAME, [stale.msg_id], "w1") == 0
+    assert not QueueService.retry_message(TASK_QUEUE_NAME, stale.msg_id, "w1", "boom")
+    assert not QueueService.release(TASK_QUEUE_NAME, stale.msg_id, "w1")
+    item = _item(current.msg_id)
+    assert not item.processed and item.lease_owner == "w2" and item.retry_count == 1
+    assert QueueService.heartbeat(TASK_QUEUE_NAME, current.msg_id, "w2")
+
+
+def test_claim_without_returning(db, monkeypatch):
+    # the mysql path: lock the candidates, lease them, then load them in the same transaction
+    monkeypatch.setattr(db.dialect, "update_returning", False)
+    task_ids = [_send() for _ in range(2)]
+
+    claimed = QueueService.read_batch(TASK_QUEUE_NAME, 3, "w1")
+    assert [msg.message["task_id"] for msg in claimed] == task_ids
+    assert all(_item(msg.msg_id).lease_owner == "w1" for msg in claimed)
+
+
+def test_cancelled_task_of_dead_worker_is_purged(db):
+    task_id = _send()
+    [msg] = QueueService.read_batch(TASK_QUEUE_NAME, 1, "w1")
+    TaskCrud.cancel_task(task_id)
+    _update(msg.msg_id, lease_expires_at=_past())
+
+    assert QueueService.reap_expired(TASK_QUEUE_NAME) == 1
+    with SessionLocal() as session:
+        assert session.query(Task).count() == 0 and session.query(TaskQueue).count() == 0
+        assert session.query(TaskDeadLetter).count() == 0
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from src.constants.enums import StopAt
+from src.models.exception import TaskCancelled, TaskInterrupted, TaskStageError
+from src.services.checkpoint import StageCheckpoints
+from src.services.stage_graph import Stage, StageGraph
+
+SCRIPT, AUDIO, TERMS, MATERIALS = StopAt.SCRIPT, StopAt.AUDIO, StopAt.TERMS, StopAt.MATERIALS
+
+
+def _graph(audio=None, terms=None):
+    return StageGraph([
+        Stage(SCRIPT, lambda outputs: {"script": "hello"}),
+        Stage(AUDIO, audio or (lambda outputs: {"audio": outputs[SCRIPT]["script"]}), (SCRIPT,), failed_reason="audio failed"),
+        Stage(TERMS, terms or (lambda outputs: {"terms": ["sea"]}), (SCRIPT,), failed_reason="terms failed"),
+        Stage(MATERIALS, lambda outputs: {"materials": outputs[TERMS]["terms"]}, (TERMS, AUDIO)),
+    ])
+
+
+def test_independent_stages_overlap():
+    both_running = threading.Barrier(2, timeout=5)
+
+    def audio(outputs):
+        both_running.wait()
+        return {"audio": "a.mp3"}
+
+    def terms(outputs):
+        both_running.wait()
+        return {"terms": ["sea"]}
+
+    done = []
+    outputs, failed = _graph(audio, terms).run([MATERIALS], on_stage_done=lambda stage, _: done.append(stage))
+    assert failed is None
+    assert outputs[MATERIALS] == {"materials": ["sea"]}
+    assert done[0] == SCRIPT and done[-1] == MATERIALS
+
+
+def test_targets_limit_stages():
+    outputs, _ = _graph().run([AUDIO])
+    assert set(outputs) == {SCRIPT, AUDIO}
+
+
+def test_failed_stage_stops_dependents():
+    outputs, failed = _graph(terms=lambda outputs: None).run([MATERIALS])
+    assert failed.failed_reason == "terms failed"
+    assert MATERIALS not in outputs
+
+
+def test_errors_name_the_stage():
+    def audio(outputs):
+        raise RuntimeError("no voice")
+
+    with pytest.raises(TaskStageError) as e:
+        _graph(audio).run([MATERIALS])
+    assert e.value.stage == AUDIO.value
+
+
+def test_resume_from_checkpoints():
+    checkpoints = StageCheckpoints()
+    checkpoints.save(SCRIPT, {"script": "cached"})
+    checkpoints.save(TERMS, {"terms": ["cached"]}, [], [SCRIPT])
+
+    def terms(outputs):
+        raise AssertionError("terms should be resumed")
+
+    outputs, _ = _graph(terms=terms).run([MATERIALS], StageCheckpoints(checkpoints.data))
+    assert outputs[AUDIO] == {"audio": "cached"}
+    assert outputs[MATERIALS] == {"materials": ["cached"]}
+
+
+def test_stop_before_next_stage():
+    with pytest.raises(TaskInterrupted):
+        _graph().run([MATERIALS], should_stop=lambda: True)
+
+
+def test_cancel_from_should_stop():
+    def should_stop():
+        raise TaskCancelled("task")
+
+    with pytest.raises(TaskCancelled):
+        _graph().run([MATERIALS], should_stop=should_stop)
@@ -0,0 +1,80 @@
+import os
+import time
+
+from src.constants.config import StorageConfig
+from src.constants.enums import StopAt
+from src.crud.task_crud import TaskCrud
+from src.crud.task_status_writer import TaskStatusWriter
+from src.models.schema import AudioRequest
+from src.services.storage_janitor import StorageJanitor, scan, select_evictions
+
+HOUR = 3600
+
+
+def _file(path, size, age):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return path
+
+
+def test_expired_then_least_recently_used(tmp_path):
+    _file(tmp_path / "old.mp4", 10, 10 * HOUR)
+    _file(tmp_path / "lru.mp4", 10, 5 * HOUR)
+    _file(tmp_path / "recent.mp4", 10, 2 * HOUR)
+    _file(tmp_path / "fresh.mp4", 10, 0)
+
+    evicted = select_evictions(scan(tmp_path), 20, 8 * HOUR, HOUR, set(), time.time())
+    assert [entry.path.name for entry in evicted] == ["old.mp4", "lru.mp4"]
+
+
+def test_keeps_in_flight_and_fresh_entries(tmp_path):
+    _file(tmp_path / "used.mp4", 10, 10 * HOUR)
+    _file(tmp_path / "fresh.mp4", 10, 0)
+
+    assert select_evictions(scan(tmp_path), 1, 8 * HOUR, HOUR, {"used.mp4"}, time.time()) == []
+
+
+def test_task_directory_uses_newest_file(tmp_path):
+    _file(tmp_path / "task" / "final-1.mp4", 10, 0)
+    _file(tmp_path / "task" / "audio.mp3", 10, 10 * HOUR)
+
+    [entry] = scan(tmp_path)
+    assert entry.size == 20
+    assert time.time() - entry.last_used < HOUR
+
+
+def test_purge_intermediates_of_finished_tasks(tmp_path):
+    finished = _file(tmp_path / "finished" / "combined-1.mp4", 10, 2 * HOUR)
+    final = _file(tmp_path / "finished" / "final-1.mp4", 10, 2 * HOUR)
+    running = _file(tmp_path / "running" / "combined-1.mp4", 10, 2 * HOUR)
+
+    janitor = StorageJanitor(StorageConfig(intermediate_ttl_seconds=HOUR), [tmp_path / "cache"], tmp_path)
+    assert janitor.purge_intermediates({"running"}, time.time()) == 1
+    assert not finished.exists() and final.exists() and running.exists()
+
+
+def test_clip_directories_share_one_budget(tmp_path, monkeypatch):
+    old = _file(tmp_path / "clips" / "old.mp4", 10, 10 * HOUR)
+    cached = _file(tmp_path / "cache_videos" / "cached.mp4", 10, 5 * HOUR)
+    fresh = _file(tmp_path / "clips" / "fresh.mp4", 10, 2 * HOUR)
+    monkeypatch.setattr(StorageJanitor, "_in_flight", staticmethod(lambda: (set(), set())))
+
+    config = StorageConfig(cache_videos_max_bytes=15, cache_videos_ttl_seconds=0, min_age_seconds=HOUR)
+    dirs = [tmp_path / "cache_videos", tmp_path / "clips", tmp_path / "missing"]
+    StorageJanitor(config, dirs, tmp_path / "tasks").run()
+    assert not old.exists() and not cached.exists() and fresh.exists()
+
+
+def test_in_flight_tasks_keep_their_clips(db):
+    task_id, _ = TaskCrud.add_task(AudioRequest(), StopAt.AUDIO)
+    with TaskStatusWriter(task_id, min_interval=0) as writer:
+        writer.update(
+            result={"materials": ["/cache/a.mp4"]},
+            checkpoints={"materials": {"output": {}, "artifacts": {"/cache/b.mp4": "digest"}, "depends_on": []}},
+        )
+
+    assert StorageJanitor._in_flight() == ({task_id}, {"a.mp4", "b.mp4"})
+    # checkpoints stay out of the result the api returns
+    assert "checkpoints" not in TaskCrud.get_task(task_id).result
@@ -0,0 +1,65 @@
+import os
+
+from edge_tts import SubMaker
+
+from src.services.tts_cache import TtsCache
+
+
+def _sub_maker():
+    sub_maker = SubMaker()
+    sub_maker.subs = ["Wise", "men", "speak"]
+    sub_maker.offset = [(0, 2000000), (2000000, 4000000), (4000000, 7000000)]
+    return sub_maker
+
+
+def test_make_key():
+    key = TtsCache.make_key("Wise men  speak.\n", "en-US-AvaMultilingualNeural", "+0%", "Audio48Khz192KBitRateMonoMp3")
+    assert key == TtsCache.make_key(" Wise men speak.", "en-US-AvaMultilingualNeural", "+0%", "Audio48Khz192KBitRateMonoMp3")
+    assert key != TtsCache.make_key("Wise men speak.", "en-US-AvaMultilingualNeural", "+10%", "Audio48Khz192KBitRateMonoMp3")
+    assert key != TtsCache.make_key("Wise men speak.", "en-US-AndrewNeural", "+0%", "Audio48Khz192KBitRateMonoMp3")
+    assert key != TtsCache.make_key("Wise men speak.", "en-US-AvaMultilingualNeural", "+0%", "Audio24Khz48KBitRateMonoMp3")
+
+
+def test_put_and_get(tmp_path):
+    cache = TtsCache(tmp_path.joinpath("cache"), 1024 * 1024)
+    audio_file = tmp_path.joinpath("audio.mp3")
+    audio_file.write_bytes(b"mp3-bytes")
+
+    assert cache.get("key", tmp_path.joinpath("miss.mp3").as_posix()) is None
+
+    cache.put("key", audio_file.as_posix(), _sub_maker())
+    target = tmp_path.joinpath("hit.mp3")
+    sub_maker = cache.get("key", target.as_posix())
+
+    assert target.read_bytes() == b"mp3-bytes"
+    assert sub_maker.subs == ["Wise", "men", "speak"]
+    assert sub_maker.offset == [(0, 2000000), (2000000, 4000000), (4000000, 7000000)]
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = TtsCache(tmp_path.joinpath("cache"), 1024 * 1024)
+    audio_file = tmp_path.joinpath("audio.mp3")
+    audio_file.write_bytes(b"x" * 1000)
+
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, audio_file.as_posix(), _sub_maker())
+        os.utime(cache.cache_dir.joinpath(f"{key}.audio"), (i, i))
+
+    cache.max_bytes = 2500
+    cache.evict()
+
+    assert not cache.cache_dir.joinpath("a.audio").exists()
+    assert not cache.cache_dir.joinpath("a.json").exists()
+    assert cache.cache_dir.joinpath("b.audio").exists()
+    assert cache.cache_dir.joinpath("c.audio").exists()
+
+
+def test_disabled(tmp_path):
+    cache = TtsCache(tmp_path.joinpath("cache"), 0)
+    audio_file = tmp_path.joinpath("audio.mp3")
+    audio_file.write_bytes(b"mp3-bytes")
+
+    cache.put("key", audio_file.as_posix(), _sub_maker())
+
+    assert not cache.cache_dir.exists()
+    assert cache.get("key", tmp_path.joinpath("hit.mp3").as_posix()) is None
@@ -0,0 +1,60 @@
+import threading
+
+from src.services.voice_catalog import VoiceCatalog
+
+voices = [
+    {"ShortName": "en-US-AvaMultilingualNeural", "SampleRateHertz": "48000", "Gender": "Female", "Locale": "en-US"},
+    {"ShortName": "en-US-AndrewNeural", "SampleRateHertz": "48000", "Gender": "Male", "Locale": "en-US"},
+    {"ShortName": "en-GB-SoniaNeural", "SampleRateHertz": "48000", "Gender": "Female", "Locale": "en-GB"},
+    {"ShortName": "de-DE-FlorianMultilingualNeural", "SampleRateHertz": "48000", "Gender": "Male", "Locale": "de-DE"},
+]
+
+
+def _names(result):
+    return [v.ShortName for v in result]
+
+
+def test_search(tmp_path):
+    catalog = VoiceCatalog(tmp_path.joinpath("voices.json"), 60, fetch=lambda: voices)
+    catalog.replace(voices)
+
+    assert len(catalog.search()) == 4
+    assert _names(catalog.search(locale="EN-us")) == ["en-US-AvaMultilingualNeural", "en-US-AndrewNeural"]
+    assert _names(catalog.search(gender="female")) == ["en-US-AvaMultilingualNeural", "en-GB-SoniaNeural"]
+    assert _names(catalog.search(multilingual=True)) == ["en-US-AvaMultilingualNeural", "de-DE-FlorianMultilingualNeural"]
+    assert _names(catalog.search(locale="en-US", multilingual=False)) == ["en-US-AndrewNeural"]
+    assert _names(catalog.search(q="Sonia", gender="Female")) == ["en-GB-SoniaNeural"]
+    assert catalog.search(locale="fr-FR") == []
+    assert catalog.locales == ["de-DE", "en-GB", "en-US"]
+
+
+def test_refresh_and_load(tmp_path):
+    catalog_file = tmp_path.joinpath("voices/azure-voices.json")
+    VoiceCatalog(catalog_file, 60, fetch=lambda: voices).refresh()
+
+    catalog = VoiceCatalog(catalog_file, 60, fetch=lambda: [])
+    assert catalog.load()
+    assert len(catalog.voices) == 4
+    assert not VoiceCatalog(tmp_path.joinpath("missing.json"), 60, fetch=lambda: []).load()
+
+
+def test_search_during_refresh(tmp_path):
+    catalog = VoiceCatalog(tmp_path.joinpath("voices.json"), 60, fetch=lambda: voices)
+    catalog.replace(voices)
+    stop = threading.Event()
+
+    def refresh():
+        while not stop.is_set():
+            catalog.replace(voices[:1])
+            catalog.replace(voices)
+
+    thread = threading.Thread(target=refresh)
+    thread.start()
+    try:
+        for _ in range(2000):
+            assert _names(catalog.search(locale="en-US")) in (
+                ["en-US-AvaMultilingualNeural"], ["en-US-AvaMultilingualNeural", "en-US-AndrewNeural"],
+            )
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,43 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.utils import http_utils
+
+
+def test_one_session_per_host():
+    session = http_utils.session_for("https://api.pexels.com/videos/search?query=sea")
+    assert http_utils.session_for("https://api.pexels.com/videos/popular") is session
+    assert http_utils.session_for("https://pixabay.com/api/videos/") is not session
+
+
+def test_proxy_applies_to_both_schemes():
+    assert http_utils.proxies("http://127.0.0.1:7890") == {"http": "http://127.0.0.1:7890", "https": "http://127.0.0.1:7890"}
+    assert http_utils.proxies("") is None
+
+
+class _FlakyHandler(BaseHTTPRequestHandler):
+    # the first request fails with 503, the ones after it succeed
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        status = 503 if self.requests == 1 else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_transient_errors_are_retried():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        response = http_utils.get(f"http://127.0.0.1:{server.server_address[1]}/", timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert response.status_code == 200
+    assert _FlakyHandler.requests == 2
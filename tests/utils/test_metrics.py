@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from src.utils import metrics
+
+
+def test_measure_collects_counters():
+    stage_metrics = {}
+    with metrics.measure(stage_metrics):
+        metrics.add("bytes_downloaded", 100)
+        metrics.add("bytes_downloaded", 50)
+        metrics.record_encode(300, 2)
+
+    assert stage_metrics["bytes_downloaded"] == 150
+    assert stage_metrics["encode_fps"] == 150
+    assert stage_metrics["wall_seconds"] >= 0
+    assert stage_metrics["cpu_seconds"] >= 0
+
+
+def test_counters_stay_in_their_thread():
+    outer, inner = {}, {}
+
+    def other_stage():
+        with metrics.measure(inner):
+            metrics.add("bytes_downloaded", 1)
+
+    with metrics.measure(outer):
+        thread = threading.Thread(target=other_stage)
+        thread.start()
+        thread.join()
+
+    metrics.add("bytes_downloaded", 1)
+    assert inner["bytes_downloaded"] == 1
+    assert "bytes_downloaded" not in outer
+
+
+@pytest.mark.skipif(not metrics.reset_peak_rss(), reason="the high-water mark can only be reset on linux")
+def test_peak_rss_is_measured_per_stage():
+    large, small = {}, {}
+    with metrics.measure(large):
+        buffer = bytearray(200 * 1024 ** 2)
+        buffer[::4096] = b"x" * len(buffer[::4096])
+        del buffer
+    with metrics.measure(small):
+        pass
+
+    assert large["peak_rss_bytes"] - small["peak_rss_bytes"] > 100 * 1024 ** 2
+    assert small["process_peak_rss_bytes"] >= large["peak_rss_bytes"]
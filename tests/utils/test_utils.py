@@ -0,0 +1,7 @@
+from src.utils import utils
+
+
+def test_fingerprint_ignores_key_order_and_excluded_keys():
+    assert utils.fingerprint({"a": 1, "b": [1, 2]}) == utils.fingerprint({"b": [1, 2], "a": 1})
+    assert utils.fingerprint({"a": 1, "seed": 2}, exclude=("seed",)) == utils.fingerprint({"a": 1})
+    assert utils.fingerprint({"a": 1}) != utils.fingerprint({"a": 2})
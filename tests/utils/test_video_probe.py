@@ -0,0 +1,38 @@
+import shutil
+
+from src.utils import video_probe
+
+VIDEO = "tests/files/videos/720x1280.mp4"
+
+
+def test_probe_reads_the_header():
+    info = video_probe.probe_mp4(VIDEO)
+    assert (info.width, info.height, info.codec) == (720, 1280, "avc1")
+    assert info.duration == 10.01 and round(info.fps, 2) == 23.98
+    assert 0 < info.keyframe_interval <= info.duration
+
+
+def test_probe_rejects_other_files(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"not a video")
+    assert video_probe.probe_mp4(str(path)) is None
+
+
+def test_info_is_stored_next_to_the_video(tmp_path):
+    path = tmp_path / "clip.mp4"
+    shutil.copyfile(VIDEO, path)
+
+    info = video_probe.probe_cached(str(path))
+    assert video_probe.load_info(str(path)) == info
+
+    # a replaced file is probed again
+    with open(path, "ab") as f:
+        f.write(b"\0")
+    assert video_probe.load_info(str(path)) is None
+
+
+def test_header_without_timing_falls_back_to_ffprobe(monkeypatch):
+    ffprobe_info = video_probe.VideoInfo(duration=10, fps=25, width=720, height=1280)
+    monkeypatch.setattr(video_probe, "probe_mp4", lambda path: video_probe.VideoInfo(0, 0, 720, 1280))
+    monkeypatch.setattr(video_probe, "probe_ffprobe", lambda path: ffprobe_info)
+    assert video_probe.probe(VIDEO) == ffprobe_info
@@ -0,0 +1,30 @@
+import time
+
+from src.services import cancellation
+from src.services.queue_service import QueueMessage
+from src.worker import heartbeat
+from src.worker.heartbeat import LeaseHeartbeat
+
+
+def _beats(monkeypatch):
+    beats = []
+    monkeypatch.setattr(heartbeat.QueueService, "heartbeat", lambda queue, msg_id, owner: beats.append(msg_id) or True)
+    return beats
+
+
+def test_lease_is_extended_while_task_progresses(monkeypatch):
+    beats = _beats(monkeypatch)
+    with LeaseHeartbeat(QueueMessage("m1", {}, lease_owner="w1"), interval=0.01, stall_seconds=0.1) as beat:
+        for _ in range(30):
+            cancellation.check()
+            time.sleep(0.01)
+        assert beat._thread.is_alive()
+    assert len(beats) > 10
+
+
+def test_stalled_task_lets_lease_expire(monkeypatch):
+    beats = _beats(monkeypatch)
+    with LeaseHeartbeat(QueueMessage("m1", {}, lease_owner="w1"), interval=0.01, stall_seconds=0.05) as beat:
+        time.sleep(0.3)
+        assert not beat._thread.is_alive()
+    assert len(beats) < 10
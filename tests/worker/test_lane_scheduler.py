@@ -0,0 +1,46 @@
+from src.constants.enums import QueueLane, StopAt
+from src.worker.lane_scheduler import LaneScheduler, parse_lane_weights
+
+QUICK = QueueLane.QUICK
+RENDER = QueueLane.RENDER
+
+
+def test_parse_lane_weights():
+    assert parse_lane_weights(["quick:3", " RENDER:1"]) == {QUICK: 3, RENDER: 1}
+    assert parse_lane_weights(["QUICK"]) == {QUICK: 1}
+
+
+def test_from_stop_at():
+    assert QueueLane.from_stop_at(StopAt.AUDIO) == QUICK
+    assert QueueLane.from_stop_at(StopAt.SUBTITLE) == QUICK
+    assert QueueLane.from_stop_at(StopAt.VIDEO) == RENDER
+
+
+def test_weighted_order():
+    scheduler = LaneScheduler([QUICK, RENDER], {QUICK: 3, RENDER: 1})
+    firsts = [scheduler.order({})[0] for _ in range(8)]
+    assert firsts.count(QUICK) == 6
+    assert firsts.count(RENDER) == 2
+    assert firsts[:4] == [QUICK, QUICK, RENDER, QUICK]
+
+
+def test_fall_through_order():
+    scheduler = LaneScheduler([QUICK, RENDER], {QUICK: 3, RENDER: 1})
+    assert scheduler.order({}) == [QUICK, RENDER]
+
+
+def test_lane_limits():
+    scheduler = LaneScheduler([QUICK, RENDER], {QUICK: 1, RENDER: 1}, limits={RENDER: 3})
+    assert scheduler.order({RENDER: 3}) == [QUICK]
+    assert RENDER in scheduler.order({RENDER: 2})
+
+    render_only = LaneScheduler([RENDER], {QUICK: 3, RENDER: 1})
+    assert render_only.order({RENDER: 10}) == [RENDER]
+
+
+def test_plan():
+    scheduler = LaneScheduler([QUICK, RENDER], {QUICK: 3, RENDER: 1}, limits={RENDER: 1})
+    assert scheduler.plan({}, 4) == {QUICK: 3, RENDER: 1}
+    assert scheduler.plan({RENDER: 1}, 2) == {QUICK: 2}
+    assert scheduler.room(RENDER, {RENDER: 1}) == 0
+    assert scheduler.room(QUICK, {QUICK: 5}) == float("inf")
@@ -0,0 +1,77 @@
+import asyncio
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from src.constants.consts import TASK_QUEUE_NAME
+from src.constants.enums import QueueLane, StopAt
+from src.crud.task_crud import TaskCrud
+from src.db.connection import SessionLocal
+from src.db.models import Task, TaskQueue
+from src.services.queue_service import QueueService
+from src.worker import task_worker
+
+
+class _BreakingExecutor:
+    """The first pool breaks on its first submit, like after a child was killed; later pools run tasks"""
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.broken = not self.instances
+        self.instances.append(self)
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        if self.broken:
+            raise BrokenProcessPool("a child process terminated abruptly")
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def _send():
+    with SessionLocal() as session:
+        task = Task(stop_at=StopAt.AUDIO.value, params={})
+        session.add(task)
+        session.commit()
+        task_id = str(task.id)
+    QueueService.send(TASK_QUEUE_NAME, {"task_id": task_id}, QueueLane.QUICK)
+
+
+def test_broken_pool_is_replaced(db, monkeypatch):
+    monkeypatch.setattr(task_worker, "ProcessPoolExecutor", _BreakingExecutor)
+    monkeypatch.setattr(task_worker.storage_janitor, "run", lambda: None)
+    monkeypatch.setattr(task_worker.env.WORKER, "concurrency", 2)
+    _send()
+    _send()
+
+    async def consume():
+        stop_event = asyncio.Event()
+        consumer = asyncio.create_task(task_worker.consume_messages(stop_event))
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            with SessionLocal() as session:
+                if session.query(TaskQueue).filter(TaskQueue.processed == False).count() == 0:
+                    break
+        stop_event.set()
+        await consumer
+
+    asyncio.run(consume())
+
+    first, second = _BreakingExecutor.instances
+    assert first.shut_down
+    with SessionLocal() as session:
+        # the released messages ran on the new pool without losing an attempt
+        assert [(item.processed, item.retry_count) for item in session.query(TaskQueue).all()] == [(True, 0)] * 2
+
+
+def test_cancelled_task_is_purged_instead_of_run(db):
+    _send()
+    message = QueueService.read(TASK_QUEUE_NAME, worker_id="w1")
+    TaskCrud.cancel_task(message.message["task_id"])
+
+    task_worker.process_task(message)
+    with SessionLocal() as session:
+        assert session.query(Task).count() == 0 and session.query(TaskQueue).count() == 0